@@ -0,0 +1,243 @@
+import os
+import csv
+import glob
+import time
+import argparse
+import tempfile
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from instance import Instance
+from models.MIP.mip import Mip_model
+from models.SMT.smt import Z3_smt_model
+from models.CP import python_minizinc as cp
+
+# Set up the argument parser to select the benchmark to run
+parser = argparse.ArgumentParser()
+subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+presolve_parser = subparsers.add_parser("presolve", help="time Instance.compute_bounds against n")
+presolve_parser.add_argument("--sizes", type=int, nargs="+", default=[10, 25, 50, 100, 200, 400, 800])
+presolve_parser.add_argument("--couriers", type=int, default=10)
+presolve_parser.add_argument("--repeat", type=int, default=5)
+presolve_parser.add_argument("--seed", type=int, default=0)
+
+mip_parser = subparsers.add_parser("mip", help="compare MIP formulations and sub-tour elimination modes")
+mip_parser.add_argument("--instances", type=str, nargs="+",
+                        default=[os.path.join("Instances", f"inst{i:02d}.dat") for i in range(1, 11)])
+mip_parser.add_argument("--formulation", type=str, nargs="+", default=["reduced"])
+mip_parser.add_argument("--subtour_elimination", type=str, nargs="+", default=["mtz", "dfj"])
+mip_parser.add_argument("--symmetry_breaking", type=int, nargs="+", default=[0],
+                        help="0 and/or 1, e.g. 0 1 to compare with and without symmetry breaking")
+mip_parser.add_argument("--timeout", type=int, default=300)
+
+smt_parser = subparsers.add_parser("smt", help="compare Z3 encodings and tactic pipelines")
+smt_parser.add_argument("--instances", type=str, nargs="+",
+                        default=[os.path.join("Instances", f"inst{i:02d}.dat") for i in range(1, 11)])
+smt_parser.add_argument("--encoding", type=str, nargs="+", default=["arith", "pb"])
+smt_parser.add_argument("--tactics", type=str, nargs="*", default=None,
+                        help="tactic pipeline for the pb encoding, QF_FD solver if omitted")
+smt_parser.add_argument("--search", type=str, default="binary")
+smt_parser.add_argument("--warm_start", action="store_true")
+smt_parser.add_argument("--symmetry_breaking", type=int, nargs="+", default=[0],
+                        help="0 and/or 1, e.g. 0 1 to compare with and without symmetry breaking")
+smt_parser.add_argument("--timeout", type=int, default=300)
+
+cp_parser = subparsers.add_parser("cp", help="sweep Gecode threads, restart schedules and LNS relaxation rates")
+cp_parser.add_argument("--instances", type=str, nargs="+",
+                       default=sorted(glob.glob(os.path.join("output_instances", "*.dzn"))))
+cp_parser.add_argument("--models", type=str, nargs="+", default=[cp.cp_model_popen, cp.cp_last_model])
+cp_parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+cp_parser.add_argument("--restarts", type=str, nargs="+", default=["1.5:1000", "1.5:100", "2:250"],
+                       help="restart_geometric schedules as base:scale")
+cp_parser.add_argument("--lns", type=int, nargs="+", default=[70, 85, 95], help="relax_and_reconstruct rates")
+cp_parser.add_argument("--times", type=float, nargs="+", default=[1, 5, 10, 30, 60],
+                       help="times [s] at which the objective is reported")
+cp_parser.add_argument("--cpus", type=int, default=os.cpu_count() or 1)
+cp_parser.add_argument("--timeout", type=int, default=60)
+cp_parser.add_argument("--output", type=str, default="cp_tuning.csv")
+
+
+def route_length(instance: 'Instance', route: 'list') -> 'int':
+
+    """
+    Length of a courier route given as 1-based item indexes, depot excluded.
+    """
+
+    path = [instance.n] + [item - 1 for item in route] + [instance.n]
+    return int(sum(instance.distances[path[i], path[i + 1]] for i in range(len(path) - 1)))
+
+
+def check_result(instance: 'Instance', result: 'dict') -> 'bool':
+
+    """
+    Checks that every item is delivered once and that the objective is the longest route.
+    Routes are in the model's courier order (max_load ascending).
+    """
+
+    if result['sol'] is None:
+        return True
+    items = sorted(item for route in result['sol'] for item in route)
+    loads_ok = all(sum(instance.size[item - 1] for item in route) <= instance.max_load[k]
+                   for k, route in enumerate(result['sol']))
+    return (items == list(range(1, instance.n + 1)) and loads_ok and
+            max(route_length(instance, route) for route in result['sol']) == result['obj'])
+
+
+def write_random_instance(file_path: 'str', m: 'int', n: 'int', seed: 'int' = 0) -> None:
+
+    """
+    Writes a random `.dat` instance with m couriers and n items.
+    Nodes are random points on a grid, so distances satisfy the triangle inequality.
+    """
+
+    rng = np.random.default_rng(seed)
+    points = rng.integers(0, 100, size=(n + 1, 2))
+    distances = np.abs(points[:, None, :] - points[None, :, :]).sum(axis=2)
+    size = rng.integers(1, 30, size=n)
+    # Give the couriers enough room to carry all the packages together
+    max_load = rng.integers(1, 10, size=m)
+    max_load = max_load * (int(size.sum()) // int(max_load.sum()) + 1) + int(size.max())
+
+    with open(file_path, "w") as f:
+        f.write(f"{m}\n{n}\n")
+        f.write(" ".join(map(str, max_load)) + "\n")
+        f.write(" ".join(map(str, size)) + "\n")
+        f.write("\n".join(" ".join(map(str, row)) for row in distances) + "\n")
+
+
+def benchmark_presolve(args) -> None:
+
+    """
+    Reports the time spent in Instance.compute_bounds for growing numbers of items.
+    """
+
+    print(f"{'n':>6} {'m':>4} {'presolve [ms]':>14}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n in args.sizes:
+            file_path = os.path.join(tmp_dir, f"inst{n}.dat")
+            write_random_instance(file_path, min(args.couriers, n), n, args.seed)
+            times = [Instance(file_path, cache_directory=None).presolve_time for _ in range(args.repeat)]
+            print(f"{n:>6} {min(args.couriers, n):>4} {1000 * min(times):>14.3f}")
+
+
+def benchmark_mip(args) -> None:
+
+    """
+    Solves each instance with every requested MIP variant and reports objective and time.
+    """
+
+    print(f"{'instance':>10} {'formulation':>12} {'subtours':>9} {'sym':>4} {'obj':>8} {'optimal':>8} {'time [s]':>9} "
+          f"{'valid':>6}")
+    for file_path in args.instances:
+        instance = Instance(file_path)
+        for formulation in args.formulation:
+            for subtour_elimination in args.subtour_elimination:
+                for symmetry_breaking in args.symmetry_breaking:
+                    start = time.time()
+                    model = Mip_model('mip', instance, formulation=formulation, subtour_elimination=subtour_elimination,
+                                      symmetry_breaking=bool(symmetry_breaking))
+                    model.solve(timeout=args.timeout)
+                    result = model.get_result()
+                    print(f"{instance.name:>10} {formulation:>12} {subtour_elimination:>9} {symmetry_breaking:>4} "
+                          f"{str(result['obj']):>8} {str(result['optimal']):>8} {time.time() - start:>9.2f} "
+                          f"{str(check_result(instance, result)):>6}", flush=True)
+
+
+def benchmark_smt(args) -> None:
+
+    """
+    Solves each instance with every requested Z3 encoding and reports objective, time and number of checks.
+    """
+
+    print(f"{'instance':>10} {'encoding':>9} {'sym':>4} {'obj':>8} {'optimal':>8} {'build [s]':>10} {'time [s]':>9} "
+          f"{'checks':>7} {'valid':>6}")
+    for file_path in args.instances:
+        instance = Instance(file_path)
+        for encoding in args.encoding:
+            for symmetry_breaking in args.symmetry_breaking:
+                start = time.time()
+                model = Z3_smt_model('z3', instance, warm_start=args.warm_start, search=args.search,
+                                     encoding=encoding, tactics=args.tactics,
+                                     symmetry_breaking=bool(symmetry_breaking))
+                build = time.time() - start
+                model.solve(timeout=args.timeout)
+                result = model.get_result()
+                print(f"{instance.name:>10} {encoding:>9} {symmetry_breaking:>4} {str(result['obj']):>8} "
+                      f"{str(result['optimal']):>8} {build:>10.2f} {time.time() - start:>9.2f} "
+                      f"{len(result['check_times']):>7} {str(check_result(instance, result)):>6}", flush=True)
+
+
+def objective_at(curve: 'list', seconds: 'float'):
+
+    """
+    Best objective found within `seconds` on a time-to-solution curve, None if there is none yet.
+    """
+
+    found = [obj for time_found, obj in curve if time_found <= seconds]
+    return found[-1] if found else None
+
+
+def benchmark_cp(args) -> None:
+
+    """
+    Runs every (instance, model, threads, restart schedule, LNS rate) configuration with Gecode,
+    as many at a time as the CPU budget allows, and writes the objective-vs-time table to a CSV file.
+    Prints the best configuration of each instance at the end.
+    """
+
+    columns = ['instance', 'n', 'model', 'threads', 'restart', 'lns', 'obj', 'optimal', 'time to best [s]'] + \
+              [f'obj@{seconds:g}s' for seconds in args.times]
+    rows = []
+    print(" ".join(f"{column:>12}" for column in columns))
+
+    # Runs with the same thread count share the CPU budget evenly
+    for threads in args.threads:
+        with ThreadPoolExecutor(max_workers=max(1, args.cpus // threads)) as pool:
+            futures = {}
+            for instance_file in args.instances:
+                for model in args.models:
+                    for restart in args.restarts:
+                        base, scale = restart.split(":")
+                        for lns in args.lns:
+                            variant = cp.search_variant(model, float(base), int(scale), lns)
+                            run_name = f"tune_{os.path.splitext(model)[0]}_p{threads}_r{base}-{scale}_l{lns}"
+                            future = pool.submit(cp.run_model, instance_file, run_name, variant, "org.gecode.gecode",
+                                                 cp.extract_solution, args.timeout, threads)
+                            futures[future] = (instance_file, model, restart, lns, run_name)
+
+            for future in as_completed(futures):
+                instance_file, model, restart, lns, run_name = futures[future]
+                result = future.result()
+                _, curve = cp.read_checkpoint(cp.checkpoint_path_for(instance_file, run_name))
+                row = [os.path.splitext(os.path.basename(instance_file))[0], cp.read_dzn(instance_file)['n'],
+                       model, threads, restart, lns, result['obj'], result['optimal'],
+                       curve[-1][0] if curve else None] + [objective_at(curve, seconds) for seconds in args.times]
+                rows.append(row)
+                print(" ".join(f"{str(value):>12}" for value in row), flush=True)
+
+    with open(args.output, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(sorted(rows, key=lambda row: [str(value) for value in row[:6]]))
+
+    # Lowest objective first, then earliest time to reach it
+    print(f"\nbest configuration per instance (table written to {args.output}):")
+    for instance in sorted({row[0] for row in rows}):
+        candidates = [row for row in rows if row[0] == instance and isinstance(row[6], int)]
+        if candidates:
+            best = min(candidates, key=lambda row: (row[6], row[8] if row[8] is not None else float('inf')))
+            print(f"{instance:>8} n={best[1]:<4} {best[2]} threads={best[3]} restart={best[4]} lns={best[5]} "
+                  f"obj={best[6]} in {best[8]} s")
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.benchmark == "presolve":
+        benchmark_presolve(args)
+    elif args.benchmark == "mip":
+        benchmark_mip(args)
+    elif args.benchmark == "smt":
+        benchmark_smt(args)
+    elif args.benchmark == "cp":
+        benchmark_cp(args)
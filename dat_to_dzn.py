@@ -1,16 +1,28 @@
 import os
-import numpy as np
+import json
+import argparse
+import hashlib
+from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor
+
+from instance import load_dat
+from presolve import load_bounds, file_digest
+
+# Bump whenever the .dzn output changes, so that every instance is converted again
+CONVERTER_VERSION = 2
+
+# Source digest, converter version and output digest of every converted instance
+manifest_file = os.path.join(".cache", "dzn_manifest.json")
 
 def read_dat_file(dat_file):
-    with open(dat_file, 'r') as file:
-        lines = [line.strip() for line in file.readlines()]
+    data = load_dat(dat_file)
 
     #M and n    
-    m = int(lines[0])                     
-    n = int(lines[1])                    
+    m = data['m']
+    n = data['n']
 
     #Capacities (ordered from the biggest to the smallest)
-    original_capacities = list(map(int, lines[2].split()))
+    original_capacities = data['max_load'].tolist()
     
     indexed_capacities = list(enumerate(original_capacities))
     sorted_capacities_desc = sorted(indexed_capacities, key=lambda x: x[1], reverse=True)
@@ -19,117 +31,129 @@ def read_dat_file(dat_file):
 
     max_load = sorted(original_capacities)
     
-    item_sizes = list(map(int, lines[3].split()))
+    item_sizes = data['size'].tolist()
     
     #Distance Matrix
-    distance_matrix = [list(map(int, line.split())) for line in lines[4:]]
+    distance_matrix = data['distances'].tolist()
     
     return m, n, ordered_capacities, original_indices, max_load, item_sizes, distance_matrix
 
-def compute_bounds(distance_matrix, max_load, size, m, n):
-    o = n
+def similar_pairs(ordered_capacities):
+    """
+    Pairs of couriers (1-based, in the .dzn order) with the same capacity, as MiniZinc sets.
+    """
+    return [{i + 1, j + 1} for i, j in combinations(range(len(ordered_capacities)), 2)
+            if ordered_capacities[i] == ordered_capacities[j]]
 
-    # Recursive function for calculating paths
-    def compute_path(current_cost, nodes, select, steps):
-        if steps > len(nodes) - 1:
-            next_step, cost = select(nodes)
-            updated_nodes = nodes + [next_step]
-            cost += current_cost
-            return compute_path(cost, updated_nodes, select, steps)
-        return {'p': nodes, 'c': current_cost}
+def format_dzn(m, n, ordered_capacities, original_indices, max_load, item_sizes, distance_matrix,
+               min_path, max_path, min_packs, max_packs):
     
-    # Function that selects the min_path
-    def min_select(nodes):
-        row = list(distance_matrix[nodes[-1]])
-        high_value = max(row) + 1
-        for j in nodes:
-            row[j] = high_value
-        c = min(row)
-        i = row.index(c)
-        return i, c
-
-    max_weight = sum(max_load[1:])
-    ordered_size = sorted(size)
+    n_array = [i+1 for i in range(n+1)]         # array[1..n+1]
+    origin = n + 1                              # origin = n+1
+    number_of_origin_stops = ((max_packs + 2) * m) - n
+    count_array = [1]*n + [number_of_origin_stops]  # array[1..n+1]
+    similars = ", ".join("{" + ",".join(map(str, sorted(pair))) + "}" for pair in similar_pairs(ordered_capacities))
     
-    k = 1
-    while k < n and sum(ordered_size[:n - k]) > max_weight:
-        k += 1
+    return "".join([
+        f"m = {m};\n",
+        f"n = {n};\n",
+        f"capacity = {ordered_capacities};\n",
+        f"item_size = {item_sizes};\n",
+        "dist_matrix = [|" + "".join(", ".join(map(str, row)) + "\n             |" for row in distance_matrix) + "];\n",
+        f"original_indices = {original_indices};\n",
+        f"min_path = {min_path};\n",
+        f"max_path = {max_path};\n",
+        f"n_array = {n_array};\n",
+        f"count_array = {count_array};\n",
+        f"max_packs = {max_packs};\n",
+        f"origin = {origin};\n",
+        f"min_packs = {min_packs};\n",
+        f"similars = [{similars}]",
+    ])
 
-    if k == 1:
-        min_path = max([ distance_matrix[o][i] + distance_matrix[i][o] for i in range(n) ])
-    else:
-        min_origin = min([ distance_matrix[i][o] for i in range(n) ])
-        min_path = max([ int(compute_path(distance_matrix[o][i], [o, i], min_select, k)['c']) + min_origin for i in range(n) ])
-    
-    #min_packs = smallest number of packs that each courier has to carry
-    k_temp = 1
-    while k_temp < n and sum(ordered_size[:n - k_temp]) > max_weight:
-        k_temp += 1
-    min_packs = k_temp 
+def write_dzn_file(dzn_file, m, n, ordered_capacities, original_indices, max_load, item_sizes, distance_matrix,
+                   min_path, max_path, min_packs, max_packs):
     
-    #max_packs = maximum number of packs that a courier can carry
-    k_val = 1
-    while k_val < n and sum(ordered_size[:k_val]) < max_load[-1]:
-        k_val += 1
-    max_packs = min(k_val, n - m + 1) 
+    text = format_dzn(m, n, ordered_capacities, original_indices, max_load, item_sizes, distance_matrix,
+                      min_path, max_path, min_packs, max_packs)
     
-    # Function that selects the max_path
-    def max_select(nodes):
-        row = list(distance_matrix[nodes[-1]])
-        for j in nodes:
-            row[j] = -1
-        c = max(row)
-        i = row.index(c)
-        return i, c
+    # Single buffered write to a temporary file, so readers never see a partial instance
+    tmp_file = f"{dzn_file}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w') as file:
+        file.write(text)
+    os.replace(tmp_file, dzn_file)
+    return hashlib.sha1(text.encode()).hexdigest()
 
-    max_paths = [ compute_path(distance_matrix[o][i], [o, i], max_select, k_val) for i in range(n) ]
-    max_path = max([ int(item['c']) + distance_matrix[item['p'][-1]][o] for item in max_paths ])
+def convert_file(dat_file, dzn_file):
+    """
+    Converts one .dat instance, returns the SHA-1 digest of the .dzn text.
+    """
+    m, n, ordered_capacities, original_indices, max_load, item_sizes, distance_matrix = read_dat_file(dat_file)
+    
+    bounds = load_bounds(dat_file, distance_matrix, max_load, item_sizes)
+    min_path, max_path = bounds['min_path'], bounds['max_path']
+    min_packs, max_packs = bounds['min_packs'], bounds['max_packs']
     
-    return min_path, max_path, min_packs, max_packs
+    return write_dzn_file(dzn_file, m, n, ordered_capacities, original_indices, max_load, item_sizes,
+                          distance_matrix, min_path, max_path, min_packs, max_packs)
 
-def write_dzn_file(dzn_file, m, n, ordered_capacities, original_indices, max_load, item_sizes, distance_matrix,
-                   min_path, max_path, min_packs, max_packs):
+def load_manifest():
+    if not os.path.exists(manifest_file):
+        return {}
+    with open(manifest_file, "r") as file:
+        return json.load(file)
+
+def save_manifest(manifest):
+    os.makedirs(os.path.dirname(manifest_file), exist_ok=True)
+    tmp_file = f"{manifest_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "w") as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(tmp_file, manifest_file)
+
+def convert_folders(input_folders, output_folder, workers=None, force=False):
+    """
+    Converts every .dat file of the input folders into output_folder, in parallel.
+    When several folders hold the same instance name, the last folder wins.
+    A file is skipped when its source digest and the converter version match the manifest
+    and the .dzn on disk is still the one written then.
+    Returns the list of (dat_file, dzn_file) pairs converted.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    manifest = load_manifest()
     
-    n_array = [i+1 for i in range(n+1)]         # array[1..n+1]
-    origin = n + 1                              # origin = n+1
-    number_of_origin_stops = ((max_packs + 2) * m) - n
-    count_array = [1]*n + [number_of_origin_stops]  # array[1..n+1]
+    sources = {}
+    for input_folder in input_folders:
+        for filename in sorted(os.listdir(input_folder)):
+            if filename.endswith(".dat"):
+                sources[os.path.join(output_folder, filename.replace(".dat", ".dzn"))] = os.path.join(input_folder, filename)
+    
+    jobs = []
+    for dzn_file, dat_file in sources.items():
+        stamp = {"source": file_digest(dat_file), "version": CONVERTER_VERSION}
+        entry = manifest.get(dzn_file)
+        if (not force and entry is not None and os.path.exists(dzn_file) and
+                {"source": entry.get("source"), "version": entry.get("version")} == stamp and
+                entry.get("output") == file_digest(dzn_file)):
+            continue
+        jobs.append((dat_file, dzn_file, stamp))
     
-    with open(dzn_file, 'w') as file:
-        file.write(f"m = {m};\n")
-        file.write(f"n = {n};\n")
-        file.write(f"capacity = {ordered_capacities};\n")
-        file.write(f"item_size = {item_sizes};\n")
-        file.write("dist_matrix = [|")
-        for row in distance_matrix:
-            file.write(", ".join(map(str, row)) + "\n             |")
-        file.write("];\n")
-        file.write(f"original_indices = {original_indices};\n")
-        file.write(f"min_path = {min_path};\n")
-        file.write(f"max_path = {max_path};\n")
-        file.write(f"n_array = {n_array};\n")
-        file.write(f"count_array = {count_array};\n")
-        file.write(f"max_packs = {max_packs};\n")
-        file.write(f"origin = {origin};\n")
-        file.write(f"min_packs = {min_packs};\n")
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            digests = pool.map(convert_file, [dat_file for dat_file, _, _ in jobs], [dzn_file for _, dzn_file, _ in jobs])
+            for (dat_file, dzn_file, stamp), digest in zip(jobs, digests):
+                manifest[dzn_file] = dict(stamp, output=digest)
+                print(f"{dat_file} -> {dzn_file} updated")
+        save_manifest(manifest)
+    
+    return [(dat_file, dzn_file) for dat_file, dzn_file, _ in jobs]
 
 if __name__ == "__main__":
-    input_folder = "instances"
-    output_folder = "output_instances"
-    
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
+    parser = argparse.ArgumentParser(description="Convert .dat instances into the .dzn files of the CP models")
+    parser.add_argument("--input", type=str, nargs="+", default=["Instances"])
+    parser.add_argument("--output", type=str, default="output_instances")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="convert every file even if it is up to date")
+    args = parser.parse_args()
     
-    for filename in os.listdir(input_folder):
-        if filename.endswith(".dat"):
-            input_dat_file = os.path.join(input_folder, filename)
-            output_dzn_file = os.path.join(output_folder, filename.replace(".dat", ".dzn"))
-            
-            m, n, ordered_capacities, original_indices, max_load, item_sizes, distance_matrix = read_dat_file(input_dat_file)
-            
-            min_path, max_path, min_packs, max_packs = compute_bounds(distance_matrix, max_load, item_sizes, m, n)
-            
-            write_dzn_file(output_dzn_file, m, n, ordered_capacities, original_indices, max_load, item_sizes,
-                           distance_matrix, min_path, max_path, min_packs, max_packs)
-            
-            print(f"{input_dat_file} -> {output_dzn_file} updated")
\ No newline at end of file
+    converted = convert_folders(args.input, args.output, args.workers, args.force)
+    print(f"{len(converted)} instance(s) converted, the others are up to date")
@@ -2,8 +2,9 @@
 set -e
 
 # 1) Esegui prima python_minizinc.py
+# (solo le istanze risolte con CP: le altre sono troppo grandi per i modelli)
 echo "→ Executing python_minizinc.py..."
-python3 models/CP/python_minizinc.py
+python3 models/CP/python_minizinc.py --instances inst01 inst02 inst03 inst04 inst05 inst06 inst07 inst08 inst09 inst10 inst13 inst16 inst19
 
 # 2) Se il comando precedente è terminato (exit code 0), esegui mcp.py
 echo "→ Executing mcp.py..."
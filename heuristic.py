@@ -0,0 +1,210 @@
+import numpy as np
+
+from instance import Instance
+
+
+def route_length(distances: 'np.ndarray', route: 'list') -> 'int':
+
+    """
+    Length of a closed route starting and ending at the depot (last node).
+    `route` holds 0-based item indexes, depot excluded.
+    """
+
+    depot = distances.shape[0] - 1
+    path = [depot] + list(route) + [depot]
+    return int(distances[path[:-1], path[1:]].sum())
+
+
+def nearest_neighbour(distances: 'np.ndarray', items: 'list') -> 'list':
+
+    """
+    Orders the given items by repeatedly moving to the closest unvisited one, starting at the depot.
+    """
+
+    current = distances.shape[0] - 1
+    remaining = list(items)
+    route = []
+    while remaining:
+        best = int(np.argmin(distances[current, remaining]))
+        current = remaining.pop(best)
+        route.append(current)
+    return route
+
+
+def two_opt(distances: 'np.ndarray', route: 'list') -> 'list':
+
+    """
+    Improves a single route with 2-opt moves (segment reversals) until no move shortens it.
+    Distances may be asymmetric, so reversing a segment also reverses the arcs inside it: with
+    prefix sums of the forward and backward arc costs along the route, the change of length of
+    every reversal is computed at once, and each pass applies the best one in O(L^2).
+    """
+
+    depot = distances.shape[0] - 1
+    best = list(route)
+    while len(best) > 1:
+        path = np.array([depot] + best + [depot])
+        forward = np.concatenate(([0], np.cumsum(distances[path[:-1], path[1:]])))
+        backward = np.concatenate(([0], np.cumsum(distances[path[1:], path[:-1]])))
+        # Reversal of the path positions a..b (1 <= a < b <= L), in a (L x L) grid
+        a, b = np.meshgrid(np.arange(1, len(path) - 1), np.arange(1, len(path) - 1), indexing='ij')
+        delta = (distances[path[a - 1], path[b]] + distances[path[a], path[b + 1]]
+                 - distances[path[a - 1], path[a]] - distances[path[b], path[b + 1]]
+                 + (backward[b] - backward[a]) - (forward[b] - forward[a]))
+        delta = np.where(a < b, delta, 0)
+        a, b = np.unravel_index(int(np.argmin(delta)), delta.shape)
+        if delta[a, b] >= 0:
+            break
+        best = best[:a] + best[a:b + 1][::-1] + best[b + 1:]
+    return best
+
+
+def cheapest_insertion(distances: 'np.ndarray', route: 'list', item: 'int') -> 'tuple':
+
+    """
+    Returns (position, route length) of the cheapest way to insert `item` in `route`.
+    """
+
+    depot = distances.shape[0] - 1
+    path = np.array([depot] + list(route) + [depot])
+    delta = distances[path[:-1], item] + distances[item, path[1:]] - distances[path[:-1], path[1:]]
+    position = int(np.argmin(delta))
+    return position, route_length(distances, route) + int(delta[position])
+
+
+def pack(size: 'list', capacity: 'list', max_packs: 'int', node_limit: 'int' = 100000) -> 'list':
+
+    """
+    Assigns packages to couriers by depth-first search, largest packages first, ignoring distances.
+    Used when the greedy assignment gets stuck on tight capacities.
+    Returns the list of items of each courier, or None if nothing is found within `node_limit` nodes.
+    """
+
+    items = sorted(range(len(size)), key=lambda j: size[j], reverse=True)
+    remaining = list(capacity)
+    assigned = [[] for _ in capacity]
+    nodes = [0]
+
+    def search(position):
+        if position == len(items):
+            return True
+        nodes[0] += 1
+        if nodes[0] > node_limit:
+            return False
+        item = items[position]
+        tried = set()
+        # Tightest fit first, couriers with the same room left are interchangeable here
+        for k in sorted(range(len(capacity)), key=lambda c: remaining[c]):
+            if remaining[k] < size[item] or len(assigned[k]) >= max_packs or remaining[k] in tried:
+                continue
+            tried.add(remaining[k])
+            remaining[k] -= size[item]
+            assigned[k].append(item)
+            if search(position + 1):
+                return True
+            assigned[k].pop()
+            remaining[k] += size[item]
+        return False
+
+    return assigned if search(0) else None
+
+
+def initial_solution(instance: 'Instance') -> 'dict':
+
+    """
+    Builds a feasible solution in a few milliseconds:
+    - capacity-aware greedy assignment: packages, largest first, go to the courier whose
+      route stays shortest after a cheapest insertion, among the couriers they fit in
+      (with a depth-first packing as fallback when capacities are too tight);
+    - couriers below min_packs receive the smallest packages that fit from the others;
+    - each route is rebuilt with nearest neighbour and improved with 2-opt;
+    - relocate moves take packages away from the longest route while this lowers the maximum.
+    Routes are given per courier in the model order (max_load ascending), as 0-based item
+    indexes, couriers with equal max_load ordered by their first item as the symmetry
+    breaking constraints of the models require. Returns {'routes': ..., 'obj': ...}, or None when no solution satisfying all the
+    model constraints (capacity, min/max packs, distance bounds) is found.
+    """
+
+    distances = np.asarray(instance.distances)
+    size = list(instance.size)
+    capacity = list(instance.max_load)
+    m, n = instance.m, instance.n
+
+    routes = [[] for _ in range(m)]
+    loads = [0] * m
+
+    # Capacity-aware greedy assignment
+    for item in sorted(range(n), key=lambda j: size[j], reverse=True):
+        best = None
+        for k in range(m):
+            if loads[k] + size[item] > capacity[k] or len(routes[k]) >= instance.max_packs:
+                continue
+            position, length = cheapest_insertion(distances, routes[k], item)
+            if best is None or length < best[2]:
+                best = (k, position, length)
+        if best is None:
+            # Capacities are too tight for the greedy choice, fall back to a plain packing
+            routes = pack(size, capacity, instance.max_packs)
+            if routes is None:
+                return None
+            loads = [sum(size[item] for item in route) for route in routes]
+            break
+        k, position, _ = best
+        routes[k].insert(position, item)
+        loads[k] += size[item]
+
+    # Repair couriers carrying fewer than min_packs packages
+    for k in range(m):
+        while len(routes[k]) < instance.min_packs:
+            donors = [(size[item], c, item) for c in range(m) if len(routes[c]) > instance.min_packs
+                      for item in routes[c] if loads[k] + size[item] <= capacity[k]]
+            if not donors:
+                return None
+            _, c, item = min(donors)
+            routes[c].remove(item)
+            loads[c] -= size[item]
+            routes[k].append(item)
+            loads[k] += size[item]
+
+    # Nearest neighbour routing improved by 2-opt
+    routes = [two_opt(distances, nearest_neighbour(distances, route)) for route in routes]
+    lengths = [route_length(distances, route) for route in routes]
+
+    # Relocate packages out of the longest route while the maximum decreases
+    improved = True
+    while improved:
+        improved = False
+        longest = int(np.argmax(lengths))
+        if len(routes[longest]) <= instance.min_packs:
+            break
+        for item in list(routes[longest]):
+            # Candidates are judged on the route without the item, 2-opt only runs on accepted moves
+            reduced = [j for j in routes[longest] if j != item]
+            reduced_length = route_length(distances, reduced)
+            for k in range(m):
+                if k == longest or loads[k] + size[item] > capacity[k] or len(routes[k]) >= instance.max_packs:
+                    continue
+                position, length = cheapest_insertion(distances, routes[k], item)
+                if max(length, reduced_length) < lengths[longest]:
+                    routes[k].insert(position, item)
+                    routes[k] = two_opt(distances, routes[k])
+                    routes[longest] = two_opt(distances, reduced)
+                    loads[k] += size[item]
+                    loads[longest] -= size[item]
+                    lengths[k] = route_length(distances, routes[k])
+                    lengths[longest] = route_length(distances, routes[longest])
+                    improved = True
+                    break
+            if improved:
+                break
+
+    # Interchangeable couriers take their routes in increasing order of first item
+    for group in instance.similar_couriers():
+        ordered = sorted((routes[k] for k in group), key=lambda route: route[0] if route else n)
+        for k, route in zip(group, ordered):
+            routes[k] = route
+
+    obj = max(lengths)
+    if obj > instance.max_path or obj < instance.min_path:
+        return None
+    return {'routes': routes, 'obj': int(obj)}
@@ -1,7 +1,68 @@
+import os
 import numpy as np
-from time import time
 from more_itertools import locate
 
+from presolve import file_digest, load_bounds
+
+
+def read_dat(file_path: 'str') -> 'dict':
+
+    """
+    Parses a `.dat` instance file in bulk.
+    The distance matrix is read with a single numpy pass and every section
+    is checked against the declared number of couriers and items.
+    """
+
+    with open(file_path, "r") as file:
+        lines = [line for line in file.read().splitlines() if line.strip() != '']
+
+    m = int(lines[0])
+    n = int(lines[1])
+    max_load = np.array(lines[2].split(), dtype=int)
+    size = np.array(lines[3].split(), dtype=int)
+
+    if len(max_load) != m:
+        raise ValueError(f"{file_path}: expected {m} courier loads, found {len(max_load)}")
+    if len(size) != n:
+        raise ValueError(f"{file_path}: expected {n} item sizes, found {len(size)}")
+    if len(lines) - 4 != n + 1:
+        raise ValueError(f"{file_path}: expected {n + 1} distance rows, found {len(lines) - 4}")
+
+    # loadtxt raises on rows with a different number of columns
+    distances = np.loadtxt(lines[4:], dtype=int, ndmin=2)
+    if distances.shape != (n + 1, n + 1):
+        raise ValueError(f"{file_path}: expected a {n + 1}x{n + 1} distance matrix, found {distances.shape}")
+
+    return {'m': m, 'n': n, 'max_load': max_load, 'size': size, 'distances': distances}
+
+
+def load_dat(file_path: 'str', cache_directory: 'str' = '.cache/instances') -> 'dict':
+
+    """
+    Loads a `.dat` instance file, going through a binary `.npz` cache keyed on
+    the file content hash so that repeated runs skip the text parsing.
+    """
+
+    if cache_directory is None:
+        return read_dat(file_path)
+
+    cache_path = os.path.join(cache_directory, file_digest(file_path) + '.npz')
+
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            return {'m': int(cached['m']), 'n': int(cached['n']), 'max_load': cached['max_load'],
+                    'size': cached['size'], 'distances': cached['distances']}
+
+    data = read_dat(file_path)
+    os.makedirs(cache_directory, exist_ok=True)
+    # Write to a temporary file first so concurrent runs never read a partial cache
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as file:
+        np.savez(file, **data)
+    os.replace(tmp_path, cache_path)
+    return data
+
+
 class Instance:
 
     """
@@ -10,46 +71,36 @@ class Instance:
     and structures for solver integration.
     """
 
-    def __init__(self, file_path: 'str') -> None:
+    def __init__(self, file_path: 'str', cache_directory: 'str' = '.cache/instances') -> None:
 
         """
         Initialize the instance from a given data file.
+        Parsed data is cached in `cache_directory` (pass None to disable it).
         """
 
         self.name = file_path.split('/')[-1].replace('.dat', '')
+        self.file_path = file_path
+        self.cache_directory = cache_directory
 
-        # Read and preprocess file content
-        file = open(file_path, "r")
-        lines = [line.replace('\n', '') for line in file]
-        file.close()
+        data = load_dat(file_path, cache_directory)
 
-        self.m = int(lines[0])
-        self.n = int(lines[1])
-        loads = lines[2].split(' ')
+        self.m = data['m']
+        self.n = data['n']
 
         # Parse max loads and sort them
-        self.max_load = [int(l) for l in loads]
-        self.max_load_indexes = np.argsort(self.max_load)
-        self.max_load = list(sorted(self.max_load))
-        
+        self.max_load_indexes = np.argsort(data['max_load'])
+        self.max_load = [int(l) for l in np.sort(data['max_load'])]
+
         # Parse package sizes
-        sizes = lines[3].split(' ')
-        self.size = [int(s) for s in sizes if s != '']
+        self.size = [int(s) for s in data['size']]
 
         # Parse distance matrix
-        lines = lines[4:]
-        self.distances = np.zeros(shape=(self.n + 1, self.n + 1), dtype=int)
-        for i in range(self.n + 1):
-            line = lines[i].split(' ')
-            for j in range(self.n + 1):
-                self.distances[i, j] = int(line[j])
+        self.distances = data['distances']
 
         self.optimal_paths = None
         self.min_path = 0
-        start_time = time()
-        
-        # Compute package count bounds
-        self.max_packs = self.n-self.m+1
+
+        # Compute distance and package count bounds
         self.compute_bounds()
 
         # Compute depot/origin representation
@@ -58,77 +109,44 @@ class Instance:
         
         self.n_array = [i+1 for i in range(self.n + 1)]
         self.count_array = [1 for _ in range(self.n)] + [self.number_of_origin_stops]
-        
-        self.presolve_time = time() - start_time
+
+        self._frozen = False
+
+    def __setattr__(self, name, value):
+        if getattr(self, '_frozen', False):
+            raise AttributeError(f"instance {self.name} is frozen, cannot set {name}")
+        super().__setattr__(name, value)
+
+    def freeze(self) -> 'Instance':
+
+        """
+        Makes the instance immutable so it can be safely shared between pipelines:
+        arrays become read-only and lists become tuples.
+        """
+
+        for name, value in vars(self).items():
+            if isinstance(value, np.ndarray):
+                value.setflags(write=False)
+            elif isinstance(value, list):
+                super().__setattr__(name, tuple(value))
+        self._frozen = True
+        return self
 
     def compute_bounds(self) -> 'None':
 
         """
         Compute lower and upper bounds for travel distance and number of packages per courier.
         These are used to guide and constrain the optimization model.
+        The computation is shared with the CP pipeline through the presolve module;
+        presolve_time is the time it took, even when the bounds come from the cache.
         """
 
-        # Depot index in distance matrix
-        o = self.n
-
-        def compute_path(current_cost, nodes, select, steps):
-            if steps > len(nodes) - 1:
-                next_step, cost = select(nodes)
-                updated_nodes = nodes + [next_step]
-                cost += current_cost
-                return compute_path(cost, updated_nodes, select, steps)
-            return {'p': nodes, 'c': current_cost}
-
-        # Exclude the weakest courier
-        max_weight = sum(self.max_load[1:])
-
-        def min_select(nodes):
-            dist = np.copy(self.distances[nodes[-1], :])
-            dist[nodes] = np.max(dist) + 1
-            c = np.min(dist)
-            i, = np.where(dist == c)
-            return i[0], c
-
-        ordered_size = sorted(self.size)
-
-        # Compute minimum number of packages needed to exceed load
-        k = 1
-        while sum(ordered_size[:self.n - k]) > max_weight:
-            k += 1
-        if k == 1:
-            self.min_path = int(np.max(
-                [self.distances[o, i] + self.distances[i, o] for i in range(self.n)]
-            ))
-        else:
-            min_origin = int(min([self.distances[i, o] for i in range(self.n)]))
-            self.min_path = int(
-                max([
-                    int(compute_path(self.distances[o, i], [o, i], min_select, k)['c']) + min_origin
-                    for i in range(self.n)
-                ]
-                ))
-
-        # Compute max_packs bound
-        k = 1
-        while sum(ordered_size[:self.n - k]) > max_weight:
-            k += 1
-        self.min_packs = k
-
-        k = 1
-        while sum(ordered_size[:k]) < self.max_load[-1] and k < self.n:
-            k += 1
-
-        self.max_packs = min(k, self.max_packs)
-
-        def max_select(nodes):
-            dist = np.copy(self.distances[nodes[-1], :])
-            dist[nodes] = -1
-            c = np.max(dist)
-            i, = np.where(dist == c)
-            return i[0], c
-
-        maxes = [compute_path(self.distances[o, i], [o, i], max_select, k) for i in range(self.n)]
-        self.max_path = int(np.max([int(m['c']) + self.distances[m['p'][-1], o] for m in maxes]))
+        bounds = load_bounds(self.file_path, self.distances, self.max_load, self.size, self.cache_directory)
+        self.min_path = bounds['min_path']
+        self.max_path = bounds['max_path']
+        self.min_packs = bounds['min_packs']
+        self.max_packs = bounds['max_packs']
+        self.presolve_time = bounds['presolve_time']
 
     def get_similar(self, loads):
 
@@ -143,3 +161,11 @@ class Instance:
                 ret_lst.append([i+1 for i in locate(loads, lambda x: x == load)])
                 added_list.append(load)
         return ret_lst
+
+    def similar_couriers(self) -> 'list':
+
+        """
+        Groups of interchangeable couriers (equal max load), as 0-based indexes in model order.
+        """
+
+        return [[k - 1 for k in group] for group in self.get_similar(list(self.max_load))]
@@ -1,37 +1,26 @@
-import json
-import os
+from result_store import Result_store
 
 
 class Json_parser:
-    # Define the paths for each approach's result folder
-    def __init__(self, result_directory_path: 'str' = '.cache/results'): 
-        self.result_directory_path = result_directory_path
-        self.model_folders = {
-            "MIP": os.path.join(result_directory_path, "MIP"),
-            "SMT": os.path.join(result_directory_path, "SMT")
-        }
+    # Results are recorded in an append-only store, res/ is produced from it by mcp.merge_json_files
+    def __init__(self, store: 'Result_store' = None):
+        self.store = store if store is not None else Result_store()
 
-    def save_results(self, model_name, instance_number, result, reorder_values, sub_folder="_None_"):
+    def save_results(self, model_name, instance_number, result, reorder_values, sub_folder="_None_", config=None,
+                     timeout=None):
 
-        # Create the approach's result folder if it doesn't exist
-        if result['time'] > 300:
-            result['time'] = 300
+        # A result reported after the time limit is recorded as a timeout, keeping its real duration
+        if timeout is not None and result['time'] > timeout:
+            print(f"{model_name} {sub_folder} on instance {instance_number} overran its {timeout}s time limit "
+                  f"({result['time']}s)")
+            result['wall_time'] = result['time']
+            result['time'] = timeout
+            result['optimal'] = False
 
-        if model_name in self.model_folders:
-            if not os.path.exists(self.model_folders[model_name]):
-                os.makedirs(self.model_folders[model_name])
-            if sub_folder != "_None_":
-                if not os.path.exists(os.path.join(self.model_folders[model_name], sub_folder)):
-                    os.makedirs(os.path.join(self.model_folders[model_name], sub_folder))
         if not result['sol'] is None:
             new_sol = result['sol'].copy()
             for i in range(len(reorder_values)):
                 new_sol[i] = result['sol'][reorder_values[i]]
 
             result['sol'] = new_sol
-        if sub_folder != "_None_":
-            instance_path = os.path.join(self.model_folders[model_name], sub_folder, f"{instance_number}.json")
-        else:
-            instance_path = os.path.join(self.model_folders[model_name], f"{instance_number}.json")
-        with open(instance_path, "w") as json_file:
-            json_file.write(json.dumps({model_name: result}, indent=4))
+        self.store.append(model_name, sub_folder, instance_number, result, config)
@@ -1,20 +1,63 @@
 import os, shutil
+from collections import OrderedDict
 
-from models.MIP.mip import Mip_model
-from models.SMT.smt import Z3_smt_model
 from instance import Instance
 from os import listdir, makedirs
 from os.path import isfile, join, exists
 import argparse
 import json
 from json_parser import Json_parser
+from result_store import Result_store
+from scheduler import Job_scheduler, build_jobs, build_model, config_hash, resume_jobs
 
 from typing import Union
+from concurrent.futures import ThreadPoolExecutor
 
 # Set up the argument parser to accept a configuration file path
 parser = argparse.ArgumentParser()
 parser.add_argument("-c", "--configuration_file", type=str)
-json_parser = Json_parser()
+parser.add_argument("-w", "--workers", type=int, default=None,
+                    help="number of parallel solver processes (overrides the configuration file)")
+parser.add_argument("-e", "--export_only", action="store_true",
+                    help="only rebuild res/ from the results already recorded, without solving")
+parser.add_argument("-r", "--resume", action="store_true",
+                    help="skip the jobs already solved to optimality with the same configuration")
+parser.add_argument("--retry_timeout", type=int, default=None,
+                    help="time budget of the jobs that timed out, when resuming (default: the configured one)")
+results_store = Result_store()
+json_parser = Json_parser(results_store)
+
+
+class Instance_registry:
+
+    """
+    Process-wide store of parsed and presolved instances.
+    Each instance file is loaded once, frozen, and the same object is handed to
+    every model family. The least recently used instances are evicted once
+    more than `max_size` are held.
+    """
+
+    def __init__(self, max_size: 'int' = 128):
+        self.max_size = max_size
+        self._instances = OrderedDict()
+
+    def get(self, file_path: 'str') -> 'Instance':
+        key = os.path.abspath(file_path)
+        if key in self._instances:
+            self._instances.move_to_end(key)
+            return self._instances[key]
+
+        instance = Instance(file_path).freeze()
+        self._instances[key] = instance
+        if len(self._instances) > self.max_size:
+            self._instances.popitem(last=False)
+        return instance
+
+    def clear(self) -> None:
+        self._instances.clear()
+
+
+instance_registry = Instance_registry()
 
 def load_parameters():
     
@@ -26,24 +69,43 @@ def load_parameters():
     args = parser.parse_args()
     with open(args.configuration_file, "r", encoding="utf-8") as f:
         parameters = json.load(f)
+    if args.workers is not None:
+        parameters['workers'] = args.workers
+    parameters['export_only'] = args.export_only
+    parameters['resume'] = args.resume
+    parameters['retry_timeout'] = args.retry_timeout
     
     return parameters
 
 
+def instance_files(instances_path: 'str') -> 'list[str]':
+
+    """
+    Filenames of the instances found in the given directory, sorted.
+    """
+
+    return sorted([f for f in listdir(instances_path) if isfile(join(instances_path, f))])
+
+
+def iter_instances(instances_path: 'str'):
+
+    """
+    Yields the instances found in the given directory, sorted by filename.
+    Instances are fetched lazily from the shared registry.
+    """
+
+    for instance_name in instance_files(instances_path):
+        yield instance_registry.get(join(instances_path, instance_name))
+
+
 def load_instances(instances_path: 'str') -> 'list[Instance]':
     
     """
     Loads all instance files found in the given directory.
-    Sorts filenames, then creates an Instance object for each file.
+    Sorts filenames, then fetches the Instance object for each file from the registry.
     """
-    
-    instances_names = sorted([f for f in listdir(instances_path) if isfile(join(instances_path, f))])
-    instances = []
-
-    for instance_name in instances_names:
-        instances.append(Instance(join(instances_path, instance_name)))
 
-    return instances
+    return list(iter_instances(instances_path))
 
 def solve_mip(config: 'dict', instances_path: 'str'):
     
@@ -54,7 +116,6 @@ def solve_mip(config: 'dict', instances_path: 'str'):
     """
     
     libraries = config['library']
-    instances = load_instances(instances_path)
 
     # Create export folder if specified and does not exist
     if config.get("export_folder", "") != "":
@@ -63,7 +124,7 @@ def solve_mip(config: 'dict', instances_path: 'str'):
 
     # Iterate through each library and each instance
     for lib in libraries:
-        for instance in instances:
+        for instance in iter_instances(instances_path):
             key = lib + '_solvers'
             solver_to_use = config[key]
             for solver_name in solver_to_use:
@@ -73,11 +134,7 @@ def solve_mip(config: 'dict', instances_path: 'str'):
                 print(f"solving instance {instance.name}")
 
                 # Instantiate the solver model depending on the library
-                if lib == 'mip':
-                    solver = Mip_model(lib, instance, solver_name=solver_name)
-
-                else:
-                    raise Exception(f"unknown lib {lib}")
+                solver = build_model('MIP', lib, solver_name, instance, config)
 
                 sub_folders = lib + '_' + solver_name
 
@@ -86,7 +143,8 @@ def solve_mip(config: 'dict', instances_path: 'str'):
                 result = solver.get_result()
 
                 # Save results using JSON parser helper
-                json_parser.save_results('MIP', instance.name, result, instance.max_load_indexes, sub_folders)
+                json_parser.save_results('MIP', instance.name, result, instance.max_load_indexes, sub_folders,
+                                         config_hash(config, sub_folders), config['timeout'])
                 print("<----------------------------------------------->")
                 print(f'solution for library {lib}:')
                 print(result)
@@ -95,75 +153,111 @@ def solve_mip(config: 'dict', instances_path: 'str'):
 def solve_smt(config: 'dict', instances_path: 'str'):
     
     """
-    Solves the problem instances using SMT models.
-    Uses only the first solver in the config's SMT solver list.
+    Solves the problem instances using SMT models, once per solver in the config's SMT solver list
+    ("z3_smt" for a single Z3 model, "z3_portfolio" for the parallel portfolio).
     """
 
-    solver_to_use = config['solvers'][0]
-
-    instances = load_instances(instances_path)
-
     if config.get("export_folder", "") != "":
         if not exists(config['export_folder']):
             makedirs(config['export_folder'])
     print(f'loaded SMT model implemented with z3')
-    for instance in instances:
-        print(f"solving instance {instance.name}")
-        print("building model...")
-        solver = Z3_smt_model("z3", instance)
-        print("model built, now solving...")
-        solver.solve(timeout=config['timeout'])
-        result = solver.get_result()
-        json_parser.save_results('SMT', instance.name, result, instance.max_load_indexes, solver_to_use)
-        print("<----------------------------------------------->")
-        print(f'solution:')
-        print(result)
+    for instance in iter_instances(instances_path):
+        for solver_to_use in config['solvers']:
+            print(f"solving instance {instance.name} with {solver_to_use}")
+            print("building model...")
+            solver = build_model('SMT', 'z3', solver_to_use, instance, config)
+            print("model built, now solving...")
+            solver.solve(processes=config.get('threads', 1), timeout=config['timeout'])
+            result = solver.get_result()
+            json_parser.save_results('SMT', instance.name, result, instance.max_load_indexes, solver_to_use,
+                                     config_hash(config, solver_to_use), config['timeout'])
+            print("<----------------------------------------------->")
+            print(f'solution:')
+            print(result)
+
+
+def solve_parallel(config: 'dict', workers: 'int', resume: 'bool' = False):
+
+    """
+    Solves every (model, library, solver, instance) job from the config
+    on a pool of worker processes, largest instances first.
+    With resume, only the jobs without a recorded optimal result for the current configuration are run.
+    """
+
+    models_to_use = config['usage_mode']['models_to_use']
+    for model in models_to_use:
+        if config[model].get("export_folder", "") != "":
+            if not exists(config[model]['export_folder']):
+                makedirs(config[model]['export_folder'])
 
+    instances = load_instances(config['instances_path'])
+    jobs = build_jobs(config, instances)
+    if resume:
+        jobs = resume_jobs(jobs, results_store.latest(), config.get('retry_timeout'))
+    print(f'scheduling {len(jobs)} jobs on {workers} workers')
+    Job_scheduler(workers, json_parser).run(jobs)
 
-def merge_json_files(input_dir, output_dir, used_models):
+
+def configured_solvers(config: 'dict') -> 'dict':
 
     """
-    Merges multiple JSON result files from different solvers into unified files per model.
-    Clears output directory for used models before merging.
+    Result sub-folders of every model in use, in the config order, named as by scheduler.build_jobs.
+    The sections of the models not in use may be missing from the config.
     """
 
-    solvers = ['mip_CBC', 'z3_smt']
-    instance_result_id = ['00', '01', '02', '03', '04', '05', '06', '07', '08', '07', '08', '09',
-                          '10', '13', '16', '19']
+    solvers = {}
+    models_to_use = config['usage_mode']['models_to_use']
+
+    if 'mip' in models_to_use:
+        solvers['MIP'] = [lib + '_' + solver_name for lib in config['mip']['library']
+                          for solver_name in config['mip'][lib + '_solvers']]
+
+    if 'smt' in models_to_use:
+        solvers['SMT'] = list(config['smt']['solvers'])
+
+    return solvers
+
+
+def merge_json_files(store: 'Result_store', output_dir: 'str', config: 'dict'):
+
+    """
+    Merges the results of the different solvers recorded in the store into unified files per model,
+    for the instances of the config's instance directory and the solvers of its model sections.
+    Only the results obtained with the current options of each solver are merged (see scheduler.config_hash).
+    The store is read in a single pass, the last record of each job winning, and the files are
+    written in parallel. Clears output directory for used models before merging.
+    """
+
+    models = [m.upper() for m in config['usage_mode']['models_to_use']]
+    solvers = configured_solvers(config)
+    instances = [filename.replace('.dat', '') for filename in instance_files(config['instances_path'])]
+    hashes = {(model, solver): config_hash(config[model.lower()], solver)
+              for model in models for solver in solvers[model]}
+
+    merged = {(model, instance): {} for model in models for instance in instances}
+    for record in store.records():
+        results = merged.get((record['model'], record['instance']))
+        job = (record['model'], record['solver'])
+        if results is not None and job in hashes and record.get('config') == hashes[job]:
+            results[record['solver']] = record['result']
 
     # Delete old results folders if they exist
-    if os.path.exists(output_dir):
-        for model in used_models:
-            model_dir = os.path.join(output_dir, model.upper())
-            if os.path.exists(model_dir):
-                shutil.rmtree(model_dir)
-
-    # Create output folders and merge data
-    for m in used_models:
-        model = m.upper()
-        out_model_dir_path = os.path.join(output_dir, model)
-        os.makedirs(out_model_dir_path)
-        for i in instance_result_id:
-            model_result_dict = {}
-            instance_name = 'inst' + i + '.json'
-            out_file_path = os.path.join(out_model_dir_path, instance_name)
-
-            # Read results from all solvers for this instance and model
-            for solver in solvers:
-                input_file_path = os.path.join(input_dir, model)
-                input_file_path = os.path.join(input_file_path, solver)
-                input_file_path = os.path.join(input_file_path, instance_name)
-
-                if os.path.exists(input_file_path):
-                    with open(input_file_path, "r") as f:
-                        data = json.load(f)
-                        tmp = data[model]
-                        model_result_dict[solver] = tmp
-
-            # Write merged result if any solver data found
-            if model_result_dict != {}:
-                with open(out_file_path, "w") as f:
-                    json.dump(model_result_dict, f)
+    for model in models:
+        model_dir = os.path.join(output_dir, model)
+        if os.path.exists(model_dir):
+            shutil.rmtree(model_dir)
+        os.makedirs(model_dir)
+
+    def write(model, instance, results):
+        # Solvers in the config order
+        with open(os.path.join(output_dir, model, instance + '.json'), "w") as f:
+            json.dump({solver: results[solver] for solver in solvers[model] if solver in results}, f)
+
+    # Write merged result if any solver data found
+    with ThreadPoolExecutor() as pool:
+        for future in [pool.submit(write, model, instance, results)
+                       for (model, instance), results in merged.items() if results]:
+            future.result()
 
     print('Results ready')
 
@@ -172,28 +266,35 @@ def main(config: 'dict'):
 
     """
     Main workflow:
-    - Clears the input cache folder if it exists
-    - Solves instances using requested models (MIP and/or SMT)
-    - Merges all JSON results into consolidated files
+    - Solves instances using requested models (MIP and/or SMT),
+      in parallel when more than one worker is configured,
+      recording each result in the results store as soon as it is available
+    - Merges the recorded results into consolidated files
+    With export_only, only the merge is done. With resume, the jobs run on the scheduler
+    (even with a single worker) and those already solved are skipped.
     """
 
-    input_directory = ".cache/results"
     output_directory = "res"
     models_to_use = config['usage_mode']['models_to_use']
 
-    # Clear old results cache
-    if os.path.exists(input_directory):
-        shutil.rmtree(input_directory)
+    if config.get('export_only', False):
+        merge_json_files(results_store, output_directory, config)
+        return
 
-    if 'mip' in models_to_use:
+    workers = config.get('workers', 1)
+    if workers > 1 or config.get('resume', False):
         print("============================================================================")
-        solve_mip(config['mip'], config['instances_path'])
-    if 'smt' in models_to_use:
-        print("============================================================================")
-        solve_smt(config['smt'], config['instances_path'])
-
-    # Merge all JSON result files into final output directory
-    merge_json_files(input_directory, output_directory, models_to_use)
+        solve_parallel(config, workers, config.get('resume', False))
+    else:
+        if 'mip' in models_to_use:
+            print("============================================================================")
+            solve_mip(config['mip'], config['instances_path'])
+        if 'smt' in models_to_use:
+            print("============================================================================")
+            solve_smt(config['smt'], config['instances_path'])
+
+    # Merge all recorded results into final output directory
+    merge_json_files(results_store, output_directory, config)
 
 
 if __name__ == '__main__':
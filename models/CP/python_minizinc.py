@@ -5,16 +5,48 @@ import io
 import math
 import re
 import json
+import hashlib
 import tempfile
 import sys
 import time
+import signal
+import argparse
+import threading
 import numpy as np
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# The runner is started as a script: make the repository modules importable
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
+from result_store import Result_store, best_result  # type: ignore
 
 # Minizinc Model definition
 cp_model = "basemodel.mzn"
 cp_model_popen = "popenmodel.mzn"
 cp_last_model = "lastmodel_sb.mzn"
 
+# Every improving solution of a run is appended to <instance>_<run>.jsonl in this folder
+checkpoint_folder = os.path.join(".cache", "cp_checkpoints")
+
+# Compiled FlatZinc (<key>.fzn / <key>.ozn), keyed on model, data, solver and MiniZinc version
+flatzinc_folder = os.path.join(".cache", "flatzinc")
+
+# Data larger than this (bytes) is written to a file instead of being passed with -D
+# (Linux limits a single command line argument to 128 KiB)
+max_cmdline_data = 100000
+
+# Models with tuned search annotations, written by search_variant
+variant_folder = os.path.join(".cache", "cp_models")
+
+# Instances with more items than this only get the popen and symmetry breaking runs
+large_instance_items = 20
+
+# Solver and flattening processes currently running, killed all at once on interruption
+running_solvers = set()
+running_solvers_lock = threading.Lock()
+# Set on interruption: no solver or flattening process is started after it
+stopping = threading.Event()
+
 def extract_route_from_row(row, origin):
     """
     Given a row [origin, node1, node2, ..., origin, ...]
@@ -121,43 +153,74 @@ def extract_solution_chuffed(output_text):
     return {"time": time_val, "optimal": optimal, "obj": obj_value, "sol": sol}
 
 
-def sort_instance_capacities(original_file):
+# Solver runs of each instance: (name in the results, model, solver, output parser)
+cp_runs = [
+    ("Cp_model_gecode", cp_model, "org.gecode.gecode", extract_solution),
+    ("Cp_model_chuffed", cp_model, "org.chuffed.chuffed", extract_solution_chuffed),
+    ("Cp_model_popen", cp_model_popen, "org.gecode.gecode", extract_solution),
+    ("Cp_model_gecode_sb", cp_last_model, "org.gecode.gecode", extract_solution),
+]
+
+@lru_cache(maxsize=None)
+def read_dzn(dzn_file):
     """
-    Reads the .dzn file, extracts 'capacity' and 'original_indices' arrays,
-    sorts capacities in descending order, writes a temporary .dzn with sorted capacities,
-    and returns (tmp_file_name, mapping).
+    Parses a .dzn instance once into a dictionary: integers, integer arrays, sets arrays
+    (similars, as lists of sets) and 2D arrays (dist_matrix, as lists of lists).
+    Cached, so all the runs of an instance share the parsed data: it must not be modified.
     """
-    
-    with open(original_file, "r") as f:
+    with open(dzn_file, "r") as f:
         content = f.read()
 
-    match_cap = re.search(r"capacity\s*=\s*(\[[^\]]+\])", content)
-    if not match_cap:
-        raise ValueError("Array 'capacity' not found in the instance file")
-    capacities = eval(match_cap.group(1))
+    data = {}
+    for statement in content.split(";"):
+        if "=" not in statement:
+            continue
+        name, value = (part.strip() for part in statement.split("=", 1))
+        if value.startswith("[|"):
+            rows = value[2:].rstrip("]").strip().strip("|").split("|")
+            data[name] = [[int(x) for x in row.split(",") if x.strip()] for row in rows if row.strip()]
+        elif value.startswith("[") and "{" in value:
+            data[name] = [{int(x) for x in group.split(",") if x.strip()}
+                          for group in value[1:-1].replace("}", "").split("{")[1:]]
+        elif value.startswith("["):
+            data[name] = [int(x) for x in value[1:-1].split(",") if x.strip()]
+        else:
+            data[name] = int(value)
+    return data
+
+def to_dzn(data):
+    """
+    Writes a data dictionary (as returned by read_dzn) back as .dzn text.
+    """
+    lines = []
+    for name, value in data.items():
+        if isinstance(value, list) and value and isinstance(value[0], list):
+            text = "[|" + "\n |".join(", ".join(map(str, row)) for row in value) + "|]"
+        elif isinstance(value, list) and value and isinstance(value[0], set):
+            text = "[" + ", ".join("{" + ",".join(map(str, sorted(group))) + "}" for group in value) + "]"
+        elif isinstance(value, list):
+            text = "[" + ", ".join(map(str, value)) + "]"
+        else:
+            text = str(value)
+        lines.append(f"{name} = {text};")
+    return "\n".join(lines) + "\n"
 
-    match_orig = re.search(r"original_indices\s*=\s*(\[[^\]]+\])", content)
-    if not match_orig:
-        raise ValueError("Array 'original_indices' not found in the instance file")
-    orig_indices = eval(match_orig.group(1))
+def sort_instance_capacities(data):
+    """
+    Sorts the capacities of the instance data in descending order.
+    Returns (sorted data, mapping), the mapping giving the original (1-based) courier of each position.
+    The data dictionary itself is left untouched.
+    """
+    capacities = data["capacity"]
+    orig_indices = data["original_indices"]
 
     indices = list(range(len(capacities)))
     sorted_order = sorted(indices, key=lambda i: capacities[i], reverse=True)
 
-    sorted_capacities = [capacities[i] for i in sorted_order]
+    sorted_data = dict(data, capacity=[capacities[i] for i in sorted_order])
     mapping = [orig_indices[i] + 1 for i in sorted_order]
 
-    new_content = re.sub(
-        r"capacity\s*=\s*\[[^\]]+\]",
-        f"capacity = {sorted_capacities}",
-        content
-    )
-
-    tmp_file = tempfile.NamedTemporaryFile(delete=False, mode="w", suffix=".dzn")
-    tmp_file.write(new_content)
-    tmp_file.close()
-
-    return tmp_file.name, mapping
+    return sorted_data, mapping
 
 def remap_solution(solution, original_indices):
     """
@@ -175,247 +238,437 @@ def remap_solution(solution, original_indices):
     solution["sol"] = [r for r in remapped_routes if r is not None]
     return solution
 
-def run_solver_run(command, timeout):
+def run_solver_stream(command, timeout, parse, checkpoint_path=None):
     """
-    Executes solvers with subprocess.run and outputs full stdout as a string.
+    Executes the solver with MiniZinc's --json-stream output and parses every solution
+    (with `parse`, extract_solution or extract_solution_chuffed) as soon as it is printed.
+    Each improving solution is appended with its time to `checkpoint_path`, one JSON object
+    per line, flushed and synced, so a crash or a kill keeps all the incumbents found so far.
+    Outputs the final solution dictionary and the time-to-solution curve [[seconds, obj], ...].
     """
-    try:
-        result = subprocess.run(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            timeout=timeout
-        )
-        return result.stdout
-    except subprocess.TimeoutExpired:
-        print("Timeout (run)!")
-        output_text = ''
-        return output_text
-
-def solve_with_run(instance_file):
-    """
-    Wrapper for subprocess.run
-    In case of KeyboardInterrupt, cleans the temporary file and outputs a "Interrupted" dictionary.
-    """
-    tmp_instance_file, mapping = sort_instance_capacities(instance_file)
-
-    model_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), cp_model)
-    cmd = [
-        "minizinc",
-        "--solver", "org.gecode.gecode",
-        "--output-time", "--solver-time-limit", "300000",
-        model_path,
-        tmp_instance_file
-    ]
+    checkpoint = None
+    if checkpoint_path is not None:
+        os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+        checkpoint = open(checkpoint_path, "w", encoding="utf-8")
 
     try:
-        output_text = run_solver_run(cmd, timeout=300)
-    except KeyboardInterrupt:
-        print("Interrupted during execution.")
-        os.remove(tmp_instance_file)
-        return {"time": 300, "optimal": False, "obj": "N/A", "sol": []}
-
-    solution_gecode = extract_solution(output_text)
-    solution_gecode = remap_solution(solution_gecode, mapping)
-
-    print("Finished running model Cp_model with gecode solver")
-    print(solution_gecode)
-
-    tmp_instance_file, mapping = sort_instance_capacities(instance_file)
+        proc = start_solver(command + ["--json-stream"], bufsize=1)
+    except Exception as e:
+        if checkpoint is not None:
+            checkpoint.close()
+        raise RuntimeError(f"Impossible to run solver: {e}")
 
-    model_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), cp_model)
-    cmd = [
-        "minizinc",
-        "--solver", "org.chuffed.chuffed",
-        "--output-time", "--solver-time-limit", "300000",
-        model_path,
-        tmp_instance_file
-    ]
+    # The solver is killed on timeout even if it stays silent
+    timer = threading.Timer(timeout, kill_process_group, args=(proc,))
+    timer.start()
+    start_time = time.time()
 
+    solution = {"time": 300, "optimal": False, "obj": "N/A", "sol": []}
+    curve = []
     try:
-        output_text = run_solver_run(cmd, timeout=300)
-    except KeyboardInterrupt:
-        print("Interrupted during execution.")
-        os.remove(tmp_instance_file)
-        return {"time": 300, "optimal": False, "obj": "N/A", "sol": []}
+        for line in proc.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(message, dict):
+                continue
+            # Messages carry the solver time in milliseconds with --output-time
+            elapsed = message.get("time", 1000 * (time.time() - start_time)) / 1000
+
+            if message.get("type") == "solution":
+                current = parse(message.get("output", {}).get("default", ""))
+                if isinstance(current["obj"], int) and (not curve or current["obj"] < curve[-1][1]):
+                    current["time"] = 300
+                    current["optimal"] = False
+                    solution = current
+                    curve.append([round(elapsed, 3), current["obj"]])
+                    if checkpoint is not None:
+                        checkpoint.write(json.dumps({"time": round(elapsed, 3), "obj": current["obj"],
+                                                     "sol": current["sol"]}) + "\n")
+                        checkpoint.flush()
+                        os.fsync(checkpoint.fileno())
+            elif message.get("type") == "status":
+                if message.get("status") == "OPTIMAL_SOLUTION":
+                    # The caller checks the proof time against its own time limit
+                    solution["time"] = math.floor(elapsed)
+                    solution["optimal"] = True
+                elif message.get("status") == "UNSATISFIABLE":
+                    solution = {"time": 300, "optimal": False, "obj": "UNSAT", "sol": []}
+            elif message.get("type") == "error":
+                solution = {"time": 300, "optimal": False, "obj": "Error", "sol": []}
+    finally:
+        timer.cancel()
+        kill_process_group(proc)
+        proc.wait()
+        with running_solvers_lock:
+            running_solvers.discard(proc)
+        if checkpoint is not None:
+            checkpoint.close()
+
+    return solution, curve
+
+def start_solver(command, **kwargs):
+    """
+    Starts a minizinc process in its own process group, so that the solver binary it runs is
+    killed with it, and registers it in running_solvers (the caller discards it once reaped).
+    Refuses to start once kill_all_solvers has been called; a process started concurrently
+    with it is killed right away.
+    """
+    if stopping.is_set():
+        raise RuntimeError("interrupted")
+    proc = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        start_new_session=(os.name == "posix"),
+        **kwargs
+    )
+    with running_solvers_lock:
+        running_solvers.add(proc)
+        if stopping.is_set():
+            kill_process_group(proc)
+    return proc
 
-    solution_chuffed = extract_solution_chuffed(output_text)
-    solution_chuffed = remap_solution(solution_chuffed, mapping)
+def kill_process_group(proc):
+    """
+    Kills the solver process together with its children (minizinc runs fzn-gecode / fzn-chuffed).
+    Called before the process is reaped, so its group id cannot have been reused.
+    """
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, signal.SIGKILL)
+        elif proc.poll() is None:
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
 
-    print("Finished running model Cp_model with chuffed solver")
-    print(solution_chuffed)
+def kill_all_solvers():
+    """
+    Kills every solver and flattening process still running, and prevents new ones from starting.
+    """
+    with running_solvers_lock:
+        stopping.set()
+        procs = list(running_solvers)
+    for proc in procs:
+        kill_process_group(proc)
 
-    os.remove(tmp_instance_file)    
-    return solution_gecode, solution_chuffed
+def read_checkpoint(checkpoint_path):
+    """
+    Reads the checkpoint written by run_solver_stream, ignoring a partially written last line.
+    Outputs the last (best) solution dictionary, or None if there is none, and the time-to-solution curve.
+    """
+    solution, curve = None, []
+    if not os.path.exists(checkpoint_path):
+        return solution, curve
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            curve.append([entry["time"], entry["obj"]])
+            solution = {"time": 300, "optimal": False, "obj": entry["obj"], "sol": entry["sol"]}
+    return solution, curve
+
+def checkpoint_path_for(instance_file, run_name):
+    """
+    Checkpoint file of a run of the given instance.
+    """
+    instance_name = os.path.splitext(os.path.basename(instance_file))[0]
+    return os.path.join(checkpoint_folder, f"{instance_name}_{run_name}.jsonl")
 
-def run_solver_popen(command, timeout):
+def recover_solution(instance_file, run_name, mapping, timeout=300):
+    """
+    Best solution checkpointed by an interrupted run, or an "Interrupted" dictionary,
+    reported with the run's time limit.
+    """
+    solution, _ = read_checkpoint(checkpoint_path_for(instance_file, run_name))
+    if solution is None:
+        return {"time": timeout, "optimal": False, "obj": "Interrupted", "sol": []}
+    solution["time"] = timeout
+    return remap_solution(solution, mapping)
+
+@lru_cache(maxsize=None)
+def minizinc_version():
     """
-    Executes the solver with subprocess.Popen, catching the output row by row
-    mantaining only the last chunk, outputted as a string.
+    Version string of the installed MiniZinc, part of the compile cache key.
     """
     try:
-        proc = subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1 
-        )
-    except Exception as e:
-        raise RuntimeError(f"Impossible to run solver: {e}")
+        return subprocess.run(["minizinc", "--version"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              text=True).stdout.strip()
+    except Exception:
+        return ""
 
-        last_chunk_text = ""
-    current_chunk = []
+def compile_model(model_path, data_text, solver, timeout):
+    """
+    Flattens the model with its data (.dzn text) for the given solver, reusing the result of a
+    previous compilation of the same model, data and solver (flattening is solver specific).
+    The data is passed on the command line (-D); only data too large for a command line
+    argument goes through a file, in a temporary folder removed right after.
+    Outputs the .fzn and .ozn paths and the flattening time in seconds (0 on a cache hit).
+    """
+    key = hashlib.sha1()
+    with open(model_path, "rb") as f:
+        key.update(f.read())
+    key.update(b"\0" + data_text.encode() + b"\0")
+    key.update(solver.encode() + b"\0" + minizinc_version().encode())
+    fzn_path = os.path.join(flatzinc_folder, key.hexdigest() + ".fzn")
+    ozn_path = os.path.join(flatzinc_folder, key.hexdigest() + ".ozn")
+    if os.path.exists(fzn_path) and os.path.exists(ozn_path):
+        return fzn_path, ozn_path, 0.0
+
+    os.makedirs(flatzinc_folder, exist_ok=True)
+    # Written under temporary names and renamed, so a concurrent or killed compilation
+    # never leaves a partial file in the cache
+    suffix = f".{os.getpid()}.{threading.get_ident()}"
+    tmp_fzn, tmp_ozn = fzn_path + suffix, ozn_path + suffix
     start_time = time.time()
-
-    while True:
-        line = proc.stdout.readline()
-        if not line:
-            break
-        stripped = line.strip()
-        if stripped == "==========":
-            proc.kill()
-            return last_chunk_text
-        if stripped == "----------":
-            chunk_text = "".join(current_chunk)
-            if chunk_text.strip():
-                last_chunk_text = chunk_text
-            current_chunk = []
+    with tempfile.TemporaryDirectory() as data_folder:
+        if len(data_text.encode()) < max_cmdline_data:
+            data_args = ["-D", data_text]
         else:
-            current_chunk.append(line)
-
-        if proc.poll() is not None:
-            break
-
-        if time.time() - start_time > timeout:
-            proc.kill()
-            break
-
-    remaining = proc.stdout.read()
-    if remaining:
-        current_chunk.append(remaining)
-
-    if current_chunk:
-        chunk_text = "".join(current_chunk)
-        if chunk_text.strip():
-            last_chunk_text = chunk_text
-
-    return last_chunk_text
-
+            data_args = [os.path.join(data_folder, "data.dzn")]
+            with open(data_args[0], "w") as f:
+                f.write(data_text)
+        proc = start_solver(["minizinc", "-c", "--solver", solver, model_path] + data_args +
+                            ["--fzn", tmp_fzn, "--ozn", tmp_ozn])
+        try:
+            output, _ = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            kill_process_group(proc)
+            proc.communicate()
+            output = "flattening timed out"
+        finally:
+            with running_solvers_lock:
+                running_solvers.discard(proc)
+    flatten_time = time.time() - start_time
+
+    if proc.returncode != 0 or not os.path.exists(tmp_fzn) or not os.path.exists(tmp_ozn):
+        for path in (tmp_fzn, tmp_ozn):
+            if os.path.exists(path):
+                os.remove(path)
+        raise RuntimeError(f"Flattening failed: {output.strip()}")
+
+    os.replace(tmp_ozn, ozn_path)
+    os.replace(tmp_fzn, fzn_path)
+    return fzn_path, ozn_path, flatten_time
+
+def search_variant(model, restart_base, restart_scale, lns_rate):
+    """
+    Copy of a model whose solve item uses restart_geometric(restart_base, restart_scale) and
+    relax_and_reconstruct(..., lns_rate) instead of its own values.
+    The copy is named after its content, so each variant is written once and compiled once.
+    Outputs the absolute path of the copy.
+    """
+    model_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), model)
+    with open(model_path, "r") as f:
+        content = f.read()
 
-def solve_with_popen(instance_file):
+    content, restarts = re.subn(r"restart_geometric\([^)]*\)",
+                                f"restart_geometric({float(restart_base)}, {int(restart_scale)})", content)
+    content, relaxations = re.subn(r"relax_and_reconstruct\((.*),\s*\d+\s*\)",
+                                   lambda match: f"relax_and_reconstruct({match.group(1)}, {int(lns_rate)})", content)
+    if not restarts or not relaxations:
+        raise ValueError(f"{model} has no restart or LNS annotation to tune")
+
+    os.makedirs(variant_folder, exist_ok=True)
+    variant_path = os.path.join(variant_folder, hashlib.sha1(content.encode()).hexdigest() + ".mzn")
+    if not os.path.exists(variant_path):
+        tmp_path = f"{variant_path}.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, variant_path)
+    return os.path.abspath(variant_path)
+
+def run_model(instance_file, run_name, model, solver, parse, timeout=300, threads=1):
     """
-    Wrapper for subprocess.Popen.
-    In case of KeyboardInterrupt, cleans the temporary file and outputs an "Interrupted" dictionary.
+    Solves one instance with one model and solver, streaming its solutions.
+    The model is flattened once per model, data and solver (see compile_model) and the solver
+    runs on the cached FlatZinc; flattening counts in the time limit and is reported as flatten_time.
+    `threads` > 1 runs Gecode in parallel (-p); the other solvers ignore it.
+    If the run fails once the solver has started, the best solution it checkpointed is output instead.
+    A solution proved optimal after `timeout` seconds (flattening included) is not reported as optimal,
+    and every solution that is not optimal is reported with `timeout` as its time.
     """
-    tmp_instance_file, mapping = sort_instance_capacities(instance_file)
+    data, mapping = sort_instance_capacities(read_dzn(instance_file))
 
-    model_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), cp_model_popen)
-    cmd = [
-        "minizinc",
-        "--solver", "org.gecode.gecode",
-        "--output-time", "--solver-time-limit", "300000",
-        model_path,
-        tmp_instance_file
-    ]
+    # A checkpoint left by an earlier sweep may come from another model, solver or time limit:
+    # only what this run streams can be recovered
+    checkpoint_path = checkpoint_path_for(instance_file, run_name)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
 
-    try:
-        last_chunk = run_solver_popen(cmd, timeout=300)
-        solution = extract_solution(last_chunk)
-        solution = remap_solution(solution, mapping)
-        print("Finished running model Cp_model_popen")
-        print(solution)
-    except KeyboardInterrupt:
-        os.remove(tmp_instance_file)
-        return {"time": 300, "optimal": False, "obj": "Interrupted", "sol": []}
-
-    tmp_instance_file, mapping = sort_instance_capacities(instance_file)
-
-    model_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), cp_last_model)
-    cmd = [
-        "minizinc",
-        "--solver", "org.gecode.gecode",
-        "--output-time", "--solver-time-limit", "300000",
-        model_path,
-        tmp_instance_file
-    ]
+    model_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), model)
 
     try:
-        last_chunk = run_solver_popen(cmd, timeout=300)
-        solution_last = extract_solution(last_chunk)
-        solution_last = remap_solution(solution_last, mapping)
-        print("Finished running model Cp_last_model")
-        print(solution_last)
-    except KeyboardInterrupt:
-        os.remove(tmp_instance_file)
-        return {"time": 300, "optimal": False, "obj": "Interrupted", "sol": []}
-
-    return solution, solution_last
+        fzn_path, ozn_path, flatten_time = compile_model(model_path, to_dzn(data), solver, timeout)
+        solve_timeout = max(1, timeout - flatten_time)
+        cmd = [
+            "minizinc",
+            "--solver", solver,
+            "--output-time", "--solver-time-limit", str(int(solve_timeout * 1000)),
+            fzn_path,
+            "--ozn-file", ozn_path
+        ]
+        if threads > 1 and solver == "org.gecode.gecode":
+            cmd[3:3] = ["-p", str(threads)]
+        solution, curve = run_solver_stream(cmd, solve_timeout, parse, checkpoint_path)
+    except Exception as e:
+        print(f"{run_name} failed on {os.path.basename(instance_file)}: {e}")
+        return recover_solution(instance_file, run_name, mapping, timeout)
+
+    solution = remap_solution(solution, mapping)
+    if solution["optimal"]:
+        solution["time"] = math.floor(solution["time"] + flatten_time)
+        solution["optimal"] = solution["time"] < timeout
+    if not solution["optimal"]:
+        solution["time"] = timeout
+    solution["flatten_time"] = round(flatten_time, 3)
+    print(f"Finished running {run_name} on {os.path.basename(instance_file)}")
+    print(solution)
+    print(f"time-to-solution curve: {curve}")
+    return solution
 
-def run_both_and_save(instance_file, output_folder):
+def run_config_hash(model, solver, threads):
     """
-    For a single instance (.dzn):
-      – if < inst11 → solve_with_run() + solve_with_popen() are both executed
-        and solutions are saved in a single JSON file.
+    Identifies the options a run's result depends on: model source, solver, Gecode threads
+    and MiniZinc version, the time budget excluded.
     """
-    sol_gecode, sol_chuffed = solve_with_run(instance_file)
-    sol_popen, sol_gecode_sb = solve_with_popen(instance_file)
+    with open(os.path.join(os.path.dirname(os.path.realpath(__file__)), model), "rb") as f:
+        key = hashlib.sha1(f.read())
+    key.update(f"\0{solver}\0{threads if solver == 'org.gecode.gecode' else 1}\0{minizinc_version()}".encode())
+    return key.hexdigest()[:16]
 
-    combined = {
-        "Cp_model_gecode": sol_gecode,
-        "Cp_model_chuffed": sol_chuffed,
-        "Cp_model_popen": sol_popen,
-        "Cp_model_gecode_sb": sol_gecode_sb
-    }
+def valid_solution(instance_file, solution):
+    """
+    Whether a recorded solution has an objective and delivers every item exactly once.
+    """
+    if not isinstance(solution.get("obj"), int) or not solution.get("sol"):
+        return False
+    items = sorted(item for route in solution["sol"] for item in route)
+    return items == list(range(1, read_dzn(instance_file)["n"] + 1))
 
-    basename = os.path.basename(instance_file)
-    inst_number = int(basename[4:6])
-    output_path = os.path.join(output_folder, f"{inst_number}.json")
+def instance_runs(instance_file):
+    """
+    Runs of an instance: all of them for small instances, only the popen and symmetry breaking
+    models above `large_instance_items` items.
+    """
+    if read_dzn(instance_file)["n"] > large_instance_items:
+        return [run for run in cp_runs if run[0] in ("Cp_model_popen", "Cp_model_gecode_sb")]
+    return list(cp_runs)
 
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(combined, f, indent=2, ensure_ascii=False)
+def instance_number(instance_file):
+    """
+    Number in the name of an instance file (inst07.dzn -> 7), which names its results file.
+    """
+    return int(re.search(r"\d+", os.path.basename(instance_file)).group())
 
-def run_only_popen_and_save(instance_file, output_folder):
+def discover_instances(data_folder, names=None):
+    """
+    The .dzn instances of data_folder, sorted by instance number.
+    `names` (e.g. inst01 or inst01.dzn) restricts them to the given instances.
+    """
+    files = [f for f in os.listdir(data_folder) if f.endswith(".dzn") and re.search(r"\d", f)]
+    if names:
+        wanted = {os.path.splitext(os.path.basename(name))[0] for name in names}
+        missing = wanted - {os.path.splitext(f)[0] for f in files}
+        if missing:
+            raise ValueError(f"instances not found in {data_folder}: {sorted(missing)}")
+        files = [f for f in files if os.path.splitext(f)[0] in wanted]
+    return [os.path.join(data_folder, f) for f in sorted(files, key=lambda f: (instance_number(f), f))]
+
+def save_instance_results(instance_file, results, output_folder):
     """
-    For instances ≥ inst11.dzn:
-      – solve_with_popen() is executed and solution is saved in a JSON file.
+    Saves the solutions of all the runs of an instance in a single JSON file.
     """
-    sol_popen, sol_gecode_sb = solve_with_popen(instance_file)
+    combined = {run[0]: results[run[0]] for run in cp_runs if run[0] in results}
 
-    single = {
-        "Cp_model_popen": sol_popen,
-        "Cp_model_gecode_sb": sol_gecode_sb
-    }
-    
-    basename = os.path.basename(instance_file)
-    inst_number = int(basename[4:6])
-    output_path = os.path.join(output_folder, f"{inst_number}.json")
+    output_path = os.path.join(output_folder, f"{instance_number(instance_file)}.json")
 
     with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(single, f, indent=2, ensure_ascii=False)
+        json.dump(combined, f, indent=2, ensure_ascii=False)
 
 def main(args):
+    """
+    Runs every model/solver variant on every instance of output_instances (or `--instances`)
+    concurrently, using at most `--cpus` CPUs (each Gecode run takes `--threads` of them), and saves
+    the results of each instance as soon as all its runs are over. Each finished run is also recorded in the results store.
+    With `--resume`, the runs recorded as optimal with the same model, solver and threads are not
+    repeated, and the timed-out or failed ones run again (for `--retry_timeout` seconds if given),
+    keeping their recorded solution unless they improve on it.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cpus", type=int, default=os.cpu_count() or 1,
+                        help="maximum number of CPUs used by the solvers at the same time")
+    parser.add_argument("--threads", type=int, default=1, help="Gecode threads per run")
+    parser.add_argument("--timeout", type=int, default=300)
+    parser.add_argument("--resume", action="store_true", help="skip the runs already solved to optimality")
+    parser.add_argument("--retry_timeout", type=int, default=None,
+                        help="time budget of the runs that timed out, when resuming")
+    parser.add_argument("--instances", type=str, nargs="*", default=None,
+                        help="instances to solve (e.g. inst01 inst07), all those of output_instances by default")
+    options = parser.parse_args(args[1:])
+
     data_folder = "output_instances"
     output_folder1 = os.path.join("..", "..")
     output_folder2 = os.path.join("res", "CP")
     output_folder = os.path.join(output_folder1, output_folder2)
     os.makedirs(output_folder, exist_ok=True)
 
-    instance_files = [
-        "inst01.dzn", "inst02.dzn", "inst03.dzn", "inst04.dzn", "inst05.dzn",
-        "inst06.dzn", "inst07.dzn", "inst08.dzn", "inst09.dzn", "inst10.dzn",
-        "inst13.dzn", "inst16.dzn", "inst19.dzn",
-    ]
-
-    for filename in instance_files:
-        filepath = os.path.join(data_folder, filename)
-        inst_number = int(filename[4:6])
+    instance_paths = discover_instances(data_folder, options.instances)
+    results = {filepath: {} for filepath in instance_paths}
+    store = Result_store()
+    records = store.latest() if options.resume else {}
 
-        if inst_number >= 11:
-            run_only_popen_and_save(filepath, output_folder)
+    def record(filepath, run_name, config, previous, solution):
+        # A run repeated after a timeout keeps its recorded solution unless the new one is better
+        if previous is not None and best_result(solution, previous) is previous:
+            solution = previous
         else:
-            run_both_and_save(filepath, output_folder)
+            store.append("CP", run_name, os.path.splitext(os.path.basename(filepath))[0], solution, config)
+        results[filepath][run_name] = solution
+
+    with ThreadPoolExecutor(max_workers=max(1, options.cpus // max(1, options.threads))) as pool:
+        futures = {}
+        for filepath in instance_paths:
+            for run_name, model, solver, parse in instance_runs(filepath):
+                config = run_config_hash(model, solver, options.threads)
+                recorded = records.get(("CP", run_name, os.path.splitext(os.path.basename(filepath))[0], config))
+                timeout, previous = options.timeout, None
+                if recorded is not None:
+                    valid = valid_solution(filepath, recorded["result"])
+                    if valid and recorded["result"]["optimal"]:
+                        results[filepath][run_name] = recorded["result"]
+                        continue
+                    previous = recorded["result"] if valid else None
+                    timeout = options.retry_timeout if options.retry_timeout is not None else options.timeout
+                future = pool.submit(run_model, filepath, run_name, model, solver, parse, timeout,
+                                     options.threads)
+                futures[future] = (filepath, run_name, config, previous)
+            if len(results[filepath]) == len(instance_runs(filepath)):
+                print(f"{os.path.basename(filepath)}: all runs already solved")
+                save_instance_results(filepath, results[filepath], output_folder)
+
+        try:
+            for future in as_completed(futures):
+                filepath, run_name, config, previous = futures[future]
+                record(filepath, run_name, config, previous, future.result())
+                if len(results[filepath]) == len(instance_runs(filepath)):
+                    save_instance_results(filepath, results[filepath], output_folder)
+        except KeyboardInterrupt:
+            # Stop everything, keeping the incumbents found so far
+            print("Interrupted, stopping all solvers.")
+            for future in futures:
+                future.cancel()
+            kill_all_solvers()
+            for future, (filepath, run_name, config, previous) in futures.items():
+                if not future.cancelled() and run_name not in results[filepath]:
+                    record(filepath, run_name, config, previous, future.result())
+            for filepath in instance_paths:
+                if results[filepath]:
+                    save_instance_results(filepath, results[filepath], output_folder)
 
 if __name__ == "__main__":
     main(sys.argv)
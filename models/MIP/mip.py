@@ -1,46 +1,148 @@
 from os.path import join
 import time
 import mip
+import numpy as np
 
 from models.general_model import general_model  # type: ignore
 from instance import Instance  # type: ignore
+from presolve import prune_arcs  # type: ignore
+from heuristic import initial_solution  # type: ignore
+
+
+class Subtour_cut_generator(mip.ConstrsGenerator):
+
+    """
+    Separates DFJ subtour-elimination constraints on demand.
+    For each courier, the item nodes touched by the current solution are split into
+    connected components (depot arcs excluded); any component S whose internal arcs
+    sum to more than |S| - 1 is a subtour and gets the cut sum(x[S, S]) <= |S| - 1.
+    Used both as lazy constraint generator (integer solutions) and as cut
+    generator (fractional solutions).
+    """
+
+    def __init__(self, table: 'dict', arcs: 'list', depot: 'int', eps: 'float' = 1e-4):
+        self.table = table
+        self.arcs = arcs
+        self.depot = depot
+        self.eps = eps
+
+    def generate_constrs(self, model: 'mip.Model', depth: 'int' = 0, npass: 'int' = 0) -> None:
+        table = model.translate(self.table)
+        cuts = mip.CutPool()
+
+        for k, arcs in enumerate(self.arcs):
+            values = {(i, j): table[k, i, j].x for i, j in arcs
+                      if i != self.depot and j != self.depot and i != j}
+            support = [(i, j) for (i, j), value in values.items() if value is not None and value > self.eps]
+
+            # Union-find over the support graph of the courier
+            parent = {}
+
+            def find(node):
+                while parent.setdefault(node, node) != node:
+                    parent[node] = parent[parent[node]]
+                    node = parent[node]
+                return node
+
+            for i, j in support:
+                parent[find(i)] = find(j)
+
+            components = {}
+            for node in parent:
+                components.setdefault(find(node), set()).add(node)
+
+            for component in components.values():
+                if len(component) < 2:
+                    continue
+                inner = [(i, j) for i, j in values if i in component and j in component]
+                if sum(values[i, j] or 0 for i, j in inner) > len(component) - 1 + self.eps:
+                    cuts.add(mip.xsum(table[k, i, j] for i, j in inner) <= len(component) - 1)
+
+        for cut in cuts.cuts:
+            model += cut
 
 
 class Mip_model(general_model):
-    
+
     """
     A Mixed Integer Programming (MIP) model to solve a multi-courier routing problem.
 
     Each courier starts and ends at a common depot and must deliver items under specific constraints:
     - Each item is delivered exactly once.
     - Couriers have load and distance limitations.
-    - Sub-tours are eliminated using the MTZ formulation.
+    - Sub-tours are eliminated using the MTZ formulation, or with DFJ cuts separated lazily.
     - The objective is to minimize the longest route among all couriers.
+
+    Two formulations are available:
+    - "dense": an integer variable for every (courier, i, j), self-loops included.
+    - "reduced": binary variables only for the arcs that survive presolve pruning
+      (no self-loops, no arcs that exceed max_path or the courier capacity).
+
+    Sub-tour elimination is either "mtz" (all MTZ rows up front) or "dfj"
+    (DFJ cuts generated on demand by Subtour_cut_generator).
+
+    Variables are created in bulk and every constraint row is computed in one
+    vectorized pass over the arc arrays before being handed to the solver.
+
+    With warm_start, the solution of heuristic.initial_solution is given to the solver as MIP start.
+
+    With symmetry_breaking, couriers with equal max load (Instance.similar_couriers) must take
+    their first items in increasing order, so only one of their permutations is searched.
     """
 
-    def __init__(self, lib: 'str', i: 'Instance', verbose: 'bool' = False, solver_name='CBC'):
+    def __init__(self, lib: 'str', i: 'Instance', verbose: 'bool' = False, solver_name='CBC',
+                 formulation: 'str' = 'dense', subtour_elimination: 'str' = 'mtz', warm_start: 'bool' = False,
+                 symmetry_breaking: 'bool' = False):
         super().__init__(lib, i)
         self._table = {}
+        self._warm_start = warm_start
+        self._symmetry_breaking = symmetry_breaking
+
+        if formulation not in ('dense', 'reduced'):
+            raise Exception(f"unknown formulation {formulation}")
+        self._formulation = formulation
+
+        if subtour_elimination not in ('mtz', 'dfj'):
+            raise Exception(f"unknown subtour elimination {subtour_elimination}")
+        self._subtour_elimination = subtour_elimination
+
+        m = self._instance.m
+        origin = self._instance.origin
 
         # Create model
         self.__model = mip.Model(solver_name=solver_name)
 
+        # Arcs each courier may use, as parallel arrays (courier, from, to)
+        if formulation == 'reduced':
+            allowed = prune_arcs(self._instance.distances, self._instance.max_load, self._instance.size,
+                                 self._instance.max_path)
+            var_type = mip.BINARY
+        else:
+            allowed = np.ones((m, origin, origin), dtype=bool)
+            var_type = mip.INTEGER
+        self.__arc_k, self.__arc_i, self.__arc_j = np.nonzero(allowed)
+        self.__arcs = [list(zip(self.__arc_i[self.__arc_k == k].tolist(), self.__arc_j[self.__arc_k == k].tolist()))
+                       for k in range(m)]
+
+        # Position of the variable of arc (k, i, j) in the arc arrays, -1 if pruned
+        self.__arc_index = np.full((m, origin, origin), -1, dtype=np.int64)
+        self.__arc_index[self.__arc_k, self.__arc_i, self.__arc_j] = np.arange(len(self.__arc_k))
+
         # Decision variables: whether courier k travels from node i to node j
-        self._table = {}
-        for k in range(self._instance.m):
-            for i in range(self._instance.origin):
-                for j in range(self._instance.origin):
-                    self._table[k, i, j] = self.__model.add_var(var_type=mip.INTEGER, name=f'table_{k}_{i}_{j}')
+        self.__arc_vars = self.__model.add_vars(len(self.__arc_k), name='table', var_type=var_type)
+        self._table = dict(zip(zip(self.__arc_k.tolist(), self.__arc_i.tolist(), self.__arc_j.tolist()),
+                               self.__arc_vars))
 
         # Total distance per courier
-        self.__courier_distance = [self.__model.add_var(var_type=mip.INTEGER, name=f'courier_distance_{k}') for k in
-                                   range(self._instance.m)]
+        self.__courier_distance = self.__model.add_vars(m, name='courier_distance', var_type=mip.INTEGER)
 
-        # Auxiliary variables to avoid sub-tours
-        for k in range(self._instance.m):
-            for i in range(self._instance.origin):
-                self._u[k, i] = self.__model.add_var(var_type=mip.INTEGER, lb=1, ub=self._instance.origin,
-                                                     name=f'u_{k}_{i}')
+        # Auxiliary variables to avoid sub-tours (MTZ only)
+        self.__u_vars = []
+        if subtour_elimination == 'mtz':
+            self.__u_vars = self.__model.add_vars(m * origin, name='u', lb=1, ub=origin, var_type=mip.INTEGER)
+            for k in range(m):
+                for i in range(origin):
+                    self._u[k, i] = self.__u_vars[k * origin + i]
 
         if not verbose:
             self.__model.verbose = 0
@@ -56,35 +158,29 @@ class Mip_model(general_model):
         # Objective function
         obj = self.__model.add_var(var_type=mip.INTEGER, name='obj')
 
-        # Define total distance per courier
-        for k in range(self._instance.m):
-            self.__model += self.__courier_distance[k] == mip.xsum(
-                self._instance.distances[i][j] * self._table[k, i, j] for i in range(self._instance.origin) for j in
-                range(self._instance.origin))
-
         # Upper and lower bounds
         self.__model += obj <= self._instance.max_path
         self.__model += obj >= self._instance.min_path
 
-        # Ensure obj is at least the max courier distance
-        for k in range(self._instance.m):
-            self.__model += obj >= self.__courier_distance[k]
-
-        # Add model constraints
-        self.__add_constraint()
+        # Add model constraints, distance definitions and obj >= courier distance included
+        self.__add_constraint(obj)
 
         # Set the objective: minimize the longest courier path
         self.__model.objective = mip.minimize(obj)
 
-        self._status = self.__model.optimize(max_seconds=int(timeout))
+        if self._warm_start:
+            self.__set_start(obj)
+
+        build_end = time.time()
+        self._status = self.__model.optimize(max_seconds=max(1, int(timeout - (build_end - self._start_time))))
         self._end_time = time.time()
         self._inst_time = self._end_time - self._start_time
-        
+
         # Store solution
         if self._status == mip.OptimizationStatus.OPTIMAL or self._status == mip.OptimizationStatus.FEASIBLE:
             self._result['time'] = round(self._inst_time, 3)
             self._result['optimal'] = self._status == mip.OptimizationStatus.OPTIMAL
-            self._result['obj'] = int(self.__model.objective_value)
+            self._result['obj'] = int(round(self.__model.objective_value))
             self._result['sol'] = self._get_solution()
 
         else:
@@ -93,62 +189,176 @@ class Mip_model(general_model):
             self._result['obj'] = None
             self._result['sol'] = None
 
-    def __add_constraint(self) -> None:
-        
+        self._result['build_time'] = round(build_end - self._start_time, 3)
+        self._result['solve_time'] = round(self._end_time - build_end, 3)
+
+    def _active_arcs(self) -> 'tuple':
+
+        """
+        Arcs in use in the solution, read in a single pass over the arc variables.
+        """
+
+        values = np.fromiter((var.x for var in self.__arc_vars), dtype=float, count=len(self.__arc_k))
+        active = values >= 0.5
+        return self.__arc_k[active], self.__arc_i[active], self.__arc_j[active]
+
+    def __set_start(self, obj: 'mip.Var') -> None:
+
+        """
+        Gives the heuristic solution to the solver as initial incumbent.
+        """
+
+        heuristic = initial_solution(self._instance)
+        if heuristic is None:
+            return
+
+        depot = self._instance.origin - 1
+        start = [(obj, heuristic['obj'])]
+        for k, route in enumerate(heuristic['routes']):
+            path = [depot] + route + [depot]
+            arcs = list(zip(path[:-1], path[1:]))
+            if any((k, i, j) not in self._table for i, j in arcs):
+                # The route uses an arc that was pruned, the start would be rejected anyway
+                return
+            start += [(self._table[k, i, j], 1.0) for i, j in arcs]
+            start.append((self.__courier_distance[k], sum(self._instance.distances[i][j] for i, j in arcs)))
+            if self._subtour_elimination == 'mtz':
+                start += [(self._u[k, item], position + 1) for position, item in enumerate(route)]
+        self.__model.start = start
+
+    def __add_rows(self, rows: 'list') -> None:
+
+        """
+        Adds a batch of constraints given in coordinate form.
+        `rows` is a list of blocks (row, column, coefficient, sense, rhs): the first three are
+        parallel arrays of nonzeros (rows numbered from 0 inside the block, columns indexing
+        self.__columns), `sense` and `rhs` are per-row arrays of the block.
+        Duplicated (row, column) entries are summed and zero coefficients are dropped.
+        """
+
+        offset = 0
+        all_rows, all_cols, all_coefs, senses, rhs = [], [], [], [], []
+        for row, col, coef, sense, b in rows:
+            all_rows.append(np.asarray(row, dtype=np.int64) + offset)
+            all_cols.append(np.asarray(col, dtype=np.int64))
+            all_coefs.append(np.asarray(coef, dtype=float))
+            senses.append(np.asarray(sense))
+            rhs.append(np.asarray(b, dtype=float))
+            offset += len(sense)
+
+        row, col, coef = np.concatenate(all_rows), np.concatenate(all_cols), np.concatenate(all_coefs)
+        senses, rhs = np.concatenate(senses), np.concatenate(rhs)
+
+        # Sum duplicated entries, sort by row then column
+        keys, inverse = np.unique(row * len(self.__columns) + col, return_inverse=True)
+        coef = np.bincount(inverse, weights=coef)
+        row, col = keys // len(self.__columns), keys % len(self.__columns)
+        keep = coef != 0
+        row, col, coef = row[keep], col[keep], coef[keep]
+
+        # Split the nonzeros row by row and feed each row to the solver
+        bounds = np.searchsorted(row, np.arange(offset + 1))
+        columns = self.__columns
+        col, coef = col.tolist(), coef.tolist()
+        for r in range(offset):
+            lo, hi = bounds[r], bounds[r + 1]
+            expr = {columns[c]: a for c, a in zip(col[lo:hi], coef[lo:hi])}
+            self.__model.add_constr(mip.LinExpr(expr=expr, const=-rhs[r], sense=str(senses[r])))
+
+    def __add_constraint(self, obj: 'mip.Var') -> None:
+
         """
         Defines and adds all problem-specific constraints to the MIP model.
         These constraints enforce feasibility, courier rules, delivery requirements,
         and ensure sub-tour elimination.
+        All rows are computed at once from the arc arrays and added in a single batch.
         """
-        
-        # Basic flow constraints: for every node and courier
-        for i in range(self._instance.origin):
-            for k in range(self._instance.m):
-                # A courier can't move to the same item
-                self.__model += self._table[k, i, i] == 0
-                # If an item is reached, it is also left by the same courier
-                self.__model += mip.xsum(self._table[k, i, j] for j in range(self._instance.origin)) == mip.xsum(
-                    self._table[k, j, i] for j in range(self._instance.origin))
+
+        m = self._instance.m
+        origin = self._instance.origin
+        depot = origin - 1
+        K, I, J = self.__arc_k, self.__arc_i, self.__arc_j
+        A = np.arange(len(K))
+        distances = np.asarray(self._instance.distances)
+        size = np.append(np.asarray(self._instance.size), 0)
+        ones = np.ones(len(K))
+
+        # Column layout: arc variables, courier distances, obj, MTZ variables
+        self.__columns = list(self.__arc_vars) + list(self.__courier_distance) + [obj] + list(self.__u_vars)
+        cd_col = len(K)
+        obj_col = cd_col + m
+        u_col = obj_col + 1
+
+        rows = []
+
+        # Define total distance per courier: courier_distance[k] - sum(d[i, j] * table[k, i, j]) == 0
+        rows.append((np.concatenate([K, np.arange(m)]), np.concatenate([A, cd_col + np.arange(m)]),
+                     np.concatenate([-distances[I, J], np.ones(m)]), np.full(m, '='), np.zeros(m)))
+
+        # Ensure obj is at least the max courier distance
+        rows.append((np.repeat(np.arange(m), 2), np.ravel(np.column_stack([np.full(m, obj_col), cd_col + np.arange(m)])),
+                     np.tile([1.0, -1.0], m), np.full(m, '>'), np.zeros(m)))
+
+        # A courier can't move to the same item (the reduced formulation has no self-loops)
+        loops = A[I == J]
+        rows.append((np.arange(len(loops)), loops, np.ones(len(loops)), np.full(len(loops), '='),
+                     np.zeros(len(loops))))
+
+        # If an item is reached, it is also left by the same courier
+        rows.append((np.concatenate([K * origin + I, K * origin + J]), np.concatenate([A, A]),
+                     np.concatenate([ones, -ones]), np.full(m * origin, '='), np.zeros(m * origin)))
 
         # Every item is delivered
-        for j in range(self._instance.origin - 1):
-            self.__model += mip.xsum(
-                self._table[k, i, j] for k in range(self._instance.m) for i in range(self._instance.origin)) == 1
-
-        # Courier-specific constraints
-        for k in range(self._instance.m):
-            # Couriers start at the origin and end at the origin
-            self.__model += mip.xsum(
-                self._table[k, self._instance.origin - 1, j] for j in range(self._instance.origin - 1)) == 1
-            self.__model += mip.xsum(
-                self._table[k, j, self._instance.origin - 1] for j in range(self._instance.origin - 1)) == 1
-
-            # Each courier can carry at most max_load items
-            self.__model += mip.xsum(
-                self._table[k, i, j] * self._instance.size[j] for i in range(self._instance.origin) for j in
-                range(self._instance.origin - 1)) <= self._instance.max_load[k]
-
-            # Each courier must visit at least min_packs items and at most max_path_length items
-            self.__model += mip.xsum(self._table[k, i, j] for i in range(self._instance.origin) for j in
-                                     range(self._instance.origin - 1)) >= self._instance.min_packs
-            self.__model += mip.xsum(self._table[k, i, j] for i in range(self._instance.origin) for j in
-                                     range(self._instance.origin - 1)) <= self._instance.max_packs
+        to_item = A[J != depot]
+        rows.append((J[to_item], to_item, ones[to_item], np.full(origin - 1, '='), np.ones(origin - 1)))
+
+        # Couriers start at the origin and end at the origin
+        leave = A[(I == depot) & (J != depot)]
+        enter = A[(J == depot) & (I != depot)]
+        rows.append((np.concatenate([K[leave], m + K[enter]]), np.concatenate([leave, enter]),
+                     np.ones(len(leave) + len(enter)), np.full(2 * m, '='), np.ones(2 * m)))
+
+        # Each courier can carry at most max_load items
+        rows.append((K[to_item], to_item, size[J[to_item]], np.full(m, '<'), np.asarray(self._instance.max_load)))
+
+        # Each courier must visit at least min_packs items and at most max_path_length items
+        rows.append((K[to_item], to_item, ones[to_item], np.full(m, '>'), np.full(m, self._instance.min_packs)))
+        rows.append((K[to_item], to_item, ones[to_item], np.full(m, '<'), np.full(m, self._instance.max_packs)))
 
         # If a courier goes for i to j then it cannot go from j to i, except for the origin
         # (this constraint it is not necessary for the model to work, but check if it improves the solution)
-        for k in range(self._instance.m):
-            for i in range(self._instance.origin - 1):
-                for j in range(self._instance.origin - 1):
-                    if i != j:
-                        self.__model += self._table[k, i, j] + self._table[k, j, i] <= 1
-
-        # Sub-tour elimination
-        for k in range(self._instance.m):
-            for i in range(self._instance.origin - 1):
-                for j in range(self._instance.origin - 1):
-                    if i != j:
-                        self.__model += self._u[k, j] - self._u[k, i] >= 1 - self._instance.origin * (
-                                1 - self._table[k, i, j])
+        between_items = A[(I != J) & (I != depot) & (J != depot)]
+        reverse = self.__arc_index[K[between_items], J[between_items], I[between_items]]
+        pairs = (reverse >= 0) & (I[between_items] < J[between_items])
+        forward, reverse = between_items[pairs], reverse[pairs]
+        rows.append((np.concatenate([np.arange(len(forward))] * 2), np.concatenate([forward, reverse]),
+                     np.ones(2 * len(forward)), np.full(len(forward), '<'), np.ones(len(forward))))
+
+        # Sub-tour elimination: u[k, j] - u[k, i] - origin * table[k, i, j] >= 1 - origin
+        if self._subtour_elimination == 'mtz':
+            n_rows = len(between_items)
+            rows.append((np.tile(np.arange(n_rows), 3),
+                         np.concatenate([u_col + K[between_items] * origin + J[between_items],
+                                         u_col + K[between_items] * origin + I[between_items],
+                                         between_items]),
+                         np.concatenate([np.ones(n_rows), -np.ones(n_rows), np.full(n_rows, -float(origin))]),
+                         np.full(n_rows, '>'), np.full(n_rows, 1.0 - origin)))
+
+        # Symmetry breaking: first item of a courier < first item of the next identical courier,
+        # sum((j + 1) * table[b, depot, j]) - sum((j + 1) * table[a, depot, j]) >= 1
+        if self._symmetry_breaking:
+            pairs = [(a, b) for group in self._instance.similar_couriers() for a, b in zip(group[:-1], group[1:])]
+            for a, b in pairs:
+                first_a, first_b = leave[K[leave] == a], leave[K[leave] == b]
+                rows.append((np.zeros(len(first_a) + len(first_b)), np.concatenate([first_b, first_a]),
+                             np.concatenate([J[first_b] + 1.0, -(J[first_a] + 1.0)]), np.array(['>']), np.ones(1)))
+
+        self.__add_rows(rows)
+
+        if self._subtour_elimination == 'dfj':
+            generator = Subtour_cut_generator(self._table, self.__arcs, depot)
+            self.__model.lazy_constrs_generator = generator
+            self.__model.cuts_generator = generator
 
     def update(self, path: 'str') -> None:
         """
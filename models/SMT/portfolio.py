@@ -0,0 +1,194 @@
+import os
+import time
+import multiprocessing
+from multiprocessing.connection import wait
+
+from models.SMT.smt import Z3_smt_model  # type: ignore
+from instance import Instance  # type: ignore
+from heuristic import initial_solution  # type: ignore
+
+
+def available_cpus() -> 'int':
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class Shared_bounds:
+
+    """
+    Objective bounds shared by the solvers of a portfolio through shared memory:
+    the best objective found by any solver and the best proved lower bound.
+    Every improving solution is also sent to the portfolio through the solver's pipe.
+    """
+
+    def __init__(self, upper: 'int', lower: 'int'):
+        self._lock = multiprocessing.Lock()
+        self._best = multiprocessing.Value('i', upper, lock=False)
+        self._lower = multiprocessing.Value('i', lower, lock=False)
+        self._conn = None
+
+    def attach(self, conn) -> None:
+
+        """
+        Sets the pipe used by the current solver process to report its solutions.
+        """
+
+        self._conn = conn
+
+    def best(self) -> 'int':
+        return self._best.value
+
+    def lower(self) -> 'int':
+        return self._lower.value
+
+    def offer(self, obj: 'int', sol: 'list') -> None:
+
+        """
+        Publishes a solution if it improves on the best one of the portfolio.
+        """
+
+        # The solution is in the pipe before the new bound is published: a solver can only prove
+        # optimality of a bound it has read, so the proof can never get ahead of the solution
+        with self._lock:
+            if obj >= self._best.value:
+                return
+            self._conn.send(('solution', obj, sol))
+            self._best.value = obj
+
+    def raise_lower(self, lower: 'int') -> None:
+        with self._lock:
+            self._lower.value = max(self._lower.value, lower)
+
+    def prove(self) -> None:
+
+        """
+        Tells the portfolio that no solution better than the best one exists.
+        """
+
+        with self._lock:
+            self._lower.value = self._best.value
+        self._conn.send(('optimal',))
+
+
+def _run_solver(lib: 'str', instance: 'Instance', config: 'dict', shared: 'Shared_bounds', timeout: 'float',
+                conn) -> None:
+
+    """
+    Worker entry point: solves the instance with one configuration of the portfolio.
+    """
+
+    shared.attach(conn)
+    try:
+        solver = Z3_smt_model(lib, instance, search=config.get('search', 'linear'),
+                              encoding=config.get('encoding', 'arith'), tactics=config.get('tactics'),
+                              seed=config.get('seed', 0), symmetry_breaking=config.get('symmetry_breaking', False))
+        solver.solve(processes=config.get('threads', 1), timeout=timeout, shared=shared)
+        conn.send(('done', solver.get_result()))
+    except Exception as e:
+        conn.send(('error', repr(e)))
+    finally:
+        conn.close()
+
+
+class Z3_portfolio:
+
+    """
+    Solves an instance with several Z3_smt_model configurations at once, one process each.
+    The configurations are the entries of the "portfolio" list of the smt config section,
+    each overriding the section's own options (encoding, search, tactics, seed, threads,
+    symmetry_breaking).
+    The solvers share the best objective and lower bound found so far, and all of them are
+    stopped as soon as one proves optimality.
+    Solvers sharing a CPU only slow each other down, so at most "portfolio_size" configurations
+    are run, by default as many as there are CPUs available, the first ones of the list first.
+    """
+
+    def __init__(self, lib: 'str', instance: 'Instance', config: 'dict', grace: 'int' = 5):
+        self._lib = lib
+        self._instance = instance
+        size = config.get('portfolio_size') or available_cpus()
+        self._variants = [dict(config, **variant) for variant in config.get('portfolio') or [{}]][:size]
+        self._warm_start = config.get('warm_start', False)
+        # Extra seconds granted on top of the timeout before killing the solvers
+        self._grace = grace
+        self._start_time = time.time()
+        self._result = {}
+
+    def solve(self, processes: 'int' = 1, timeout: 'int' = 300) -> None:
+
+        """
+        Runs all the configurations until one proves optimality or the time is over,
+        keeping the best solution reported by any of them.
+        `processes` is the number of Z3 threads of the configurations that do not set "threads".
+        """
+
+        # The heuristic incumbent is computed once and shared by all the solvers
+        heuristic = initial_solution(self._instance) if self._warm_start else None
+        best_obj, best_sol = None, None
+        if heuristic is not None:
+            best_obj = heuristic['obj']
+            best_sol = [[item + 1 for item in route] for route in heuristic['routes']]
+        shared = Shared_bounds(best_obj if best_obj is not None else self._instance.max_path + 1,
+                               self._instance.min_path)
+
+        remaining = timeout - (time.time() - self._start_time)
+        deadline = time.time() + remaining + self._grace
+        running = []
+        for config in self._variants:
+            recv_conn, send_conn = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_run_solver, daemon=True,
+                                              args=(self._lib, self._instance, dict({'threads': processes}, **config),
+                                                    shared, remaining, send_conn))
+            process.start()
+            send_conn.close()
+            running.append((process, recv_conn))
+
+        self._best = (best_obj, best_sol)
+        self._optimal = False
+        while running and not self._optimal:
+            ready = wait([conn for _, conn in running], timeout=max(0.0, deadline - time.time()))
+            if not ready:
+                break
+            for process, conn in list(running):
+                if conn in ready and self.__receive(conn):
+                    process.join()
+                    conn.close()
+                    running.remove((process, conn))
+
+        # Optimality is proved or the time is over: the remaining solvers are stopped,
+        # after reading the solutions already sent
+        for process, conn in running:
+            while conn.poll() and not self.__receive(conn):
+                pass
+            process.kill()
+            process.join()
+            conn.close()
+
+        self._result['time'] = round(time.time() - self._start_time, 3)
+        self._result['optimal'] = self._optimal
+        self._result['obj'], self._result['sol'] = self._best
+
+    def __receive(self, conn) -> 'bool':
+
+        """
+        Handles one message from a solver. Returns True once the solver has finished.
+        """
+
+        try:
+            message = conn.recv()
+        except EOFError:
+            message = ('error', 'solver exited without a result')
+        if message[0] == 'solution':
+            if self._best[0] is None or message[1] < self._best[0]:
+                self._best = (message[1], message[2])
+        elif message[0] == 'optimal':
+            self._optimal = True
+        else:
+            if message[0] == 'error':
+                print(f"portfolio solver failed on instance {self._instance.name}: {message[1]}")
+            return True
+        return False
+
+    def get_result(self) -> 'dict':
+        return self._result
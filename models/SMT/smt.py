@@ -4,6 +4,7 @@ import numpy as np
 
 from models.general_model import general_model  # type: ignore
 from instance import Instance  # type: ignore
+from heuristic import initial_solution, route_length  # type: ignore
 
 
 class Z3_smt_model(general_model):
@@ -14,18 +15,49 @@ class Z3_smt_model(general_model):
     traveled by any courier while satisfying constraints such as capacity, coverage, and tour validity.
     """
 
-    def __init__(self, lib: 'str', instance: Instance):
+    def __init__(self, lib: 'str', instance: Instance, warm_start: 'bool' = False, search: 'str' = 'linear',
+                 encoding: 'str' = 'arith', tactics: 'list' = None, seed: 'int' = 0,
+                 symmetry_breaking: 'bool' = False):
         """
         Initializes the SMT model, decision variables, and bounds.
+        With warm_start, the objective of heuristic.initial_solution is used as initial cutoff.
+        `search` selects how the objective is minimized, "linear" or "binary".
+        `encoding` selects the constraint encoding: "arith" (integer distances and MTZ variables)
+        or "pb" (pseudo-boolean constraints only, see add_pb_constraints). With "pb", `tactics`
+        optionally gives the Z3 tactic pipeline used to build the solver, e.g.
+        ["simplify", "solve-eqs", "pb2bv", "bit-blast", "sat"]; the QF_FD solver is used otherwise.
+        A non-zero `seed` sets the solver random seed (used to diversify a portfolio).
+        With `symmetry_breaking`, identical couriers are ordered (see add_symmetry_breaking).
         """
         super().__init__(lib, instance)
+        self._warm_start = warm_start
+        if search not in ('linear', 'binary'):
+            raise Exception(f"unknown search {search}")
+        if encoding not in ('arith', 'pb'):
+            raise Exception(f"unknown encoding {encoding}")
+        self._search = search
+        self._encoding = encoding
+        self._seed = seed
+        self._check_times = []
         self._model = None
+        # Last model whose routes were extracted, with its routes
+        self._solution_cache = (None, None)
         self._optimal_solution_found = False
-        self._solver = z3.Solver()
 
         #Defines the decision variable _table: a boolean variable that represents whether the courier k moves from i to j
         self._table = np.array([[[z3.Bool(f'table_{k}_{i}_{j}') for j in range(self._instance.origin)]
                                  for i in range(self._instance.origin)] for k in range(self._instance.m)])
+
+        if encoding == 'pb':
+            self._solver = z3.Then(*tactics).solver() if tactics else z3.SolverFor('QF_FD')
+            self.add_pb_constraints()
+            if symmetry_breaking:
+                self.add_symmetry_breaking()
+            self._end_time = time.time()
+            return
+
+        self._solver = z3.Solver()
+
         #define distance variable
         self._courier_distance = np.array([z3.Int(f'courier_distance_{k}') for k in range(self._instance.m)])
 
@@ -45,6 +77,8 @@ class Z3_smt_model(general_model):
                 self._solver.add(self._u[k][i] <= instance.origin - 1)
 
         self.__build()
+        if symmetry_breaking:
+            self.add_symmetry_breaking()
         self._end_time = time.time()
 
     def __build(self):
@@ -74,47 +108,243 @@ class Z3_smt_model(general_model):
 
         self.add_constraints()
 
-    def solve(self, processes=1, timeout: 'int' = 300) -> None:
+    def solve(self, processes=1, timeout: 'int' = 300, shared: 'Shared_bounds' = None) -> None:
 
         """
         Solves the SMT model, minimizing the maximum route distance. Uses iterative
-        tightening to ensure optimality if possible.
+        tightening ("linear") or bisection over [min_path, incumbent] ("binary")
+        to ensure optimality if possible. The duration of every check is recorded.
+        The whole run, model construction included, stops at `timeout` seconds and
+        returns the best incumbent found so far.
+        `processes` sets the number of Z3 threads. `shared` connects the model to the other
+        solvers of a portfolio (see models/SMT/portfolio.py): their best objective and proved
+        lower bound restrict the search before every check, and this model's own are published.
         """
 
-        self._inst_time = self._end_time - self._start_time
+        # Every check gets only what is left of the budget, measured from the model construction
+        self._deadline = self._start_time + timeout
+        self._shared = shared
 
-        if self._inst_time >= timeout:
-            self._result['time'] = round(self._inst_time, 3)
-            self._result['optimal'] = self._optimal_solution_found
-            self._result['obj'] = None
-            self._result['sol'] = None
+        # Start from the heuristic incumbent: only solutions at least as good are searched
+        heuristic = initial_solution(self._instance) if self._warm_start else None
+        if heuristic is not None:
+            self._solver.add(self.__objective_at_most(heuristic['obj']))
 
-        self._solver.set("timeout", int(timeout - self._inst_time) * 1000)
         #if processes > 1 it sets multithreading
         if processes > 1:
             self._solver.set("threads", processes)
-        # Loop until no better solution is found
-        while self._solver.check() == z3.sat:
-            self._model = self._solver.model()
-            self._solver.add(self.obj < self._model[self.obj])
+        if self._seed:
+            self._solver.set("random_seed", self._seed)
 
-            # Check if the solution is optimal
-            if self._solver.check() == z3.unsat:
-                self._end_time = time.time()
-                self._inst_time = self._end_time - self._start_time
+        # Best objective known, whoever found it (this model, the heuristic or the portfolio)
+        self._upper = heuristic['obj'] if heuristic is not None else self._instance.max_path + 1
 
-                # Convert table to a list of lists of booleans
-                self._table = [[[self._model[self._table[k][i][j]] for j in range(self._instance.origin)] for i in
-                                range(self._instance.origin)] for k
-                               in
-                               range(self._instance.m)]
+        if self._search == 'binary':
+            self.__binary_search()
+        else:
+            self.__linear_search()
 
-                self._optimal_solution_found = True
+        # Wall time of the whole run, whether it ended on optimality or on the deadline
+        self._end_time = time.time()
+        self._inst_time = self._end_time - self._start_time
 
         self._result['time'] = round(self._inst_time, 3)
         self._result['optimal'] = self._optimal_solution_found
-        self._result['obj'] = self._model[self.obj].as_long()
-        self._result['sol'] = self._get_solution()
+        if self._model is not None:
+            self._result['obj'] = self.__objective_value(self._model)
+            self._result['sol'] = self.__solution(self._model)
+        elif heuristic is not None:
+            # Nothing better than the heuristic incumbent was found in time
+            self._result['obj'] = heuristic['obj']
+            self._result['sol'] = [[item + 1 for item in route] for route in heuristic['routes']]
+        else:
+            self._result['obj'] = None
+            self._result['sol'] = None
+        self._result['check_times'] = self._check_times
+
+    def __objective_at_most(self, value: 'int'):
+
+        """
+        Constraint stating that no courier travels more than `value`.
+        The pb encoding has no objective variable, so every courier's weighted arcs are bounded instead.
+        """
+
+        if self._encoding == 'arith':
+            return self.obj <= value
+        return z3.And([z3.PbLe(terms, value) for terms in self._distance_terms if terms])
+
+    def __objective_value(self, model) -> 'int':
+
+        """
+        Objective of a model: the value of obj, or the longest route recomputed from the arcs in the pb encoding.
+        """
+
+        if self._encoding == 'arith':
+            return model[self.obj].as_long()
+        distances = np.asarray(self._instance.distances)
+        return max(route_length(distances, [item - 1 for item in route]) for route in self.__solution(model))
+
+    def __successor(self, model, k: 'int', i: 'int') -> 'int':
+
+        """
+        Node courier k goes to after node i in a model, -1 if it does not leave i.
+        The interpretations are read through the Z3 C API, stopping at the first true arc of the row.
+        """
+
+        ctx, values = model.ctx.ref(), model.model
+        for j, arc in enumerate(self._table[k][i]):
+            value = z3.Z3_model_get_const_interp(ctx, values, z3.Z3_get_app_decl(ctx, arc.as_ast()))
+            if value and z3.Z3_get_bool_value(ctx, value) == z3.Z3_L_TRUE:
+                return j
+        return -1
+
+    def __solution(self, model) -> 'list':
+
+        """
+        Routes of a model, as returned by _get_solution.
+        Only the rows of the nodes on each route are read, following the successors from the depot,
+        so the extraction scales with the route lengths instead of m * origin^2 model lookups.
+        """
+
+        if self._solution_cache[0] is model:
+            return self._solution_cache[1]
+        depot = self._instance.origin - 1
+        couriers, tails, heads = [], [], []
+        for k in range(self._instance.m):
+            current, visited = depot, set()
+            # Stops back at the depot, on a node without successor, or on a cycle (reported by _get_solution)
+            while current not in visited:
+                visited.add(current)
+                following = self.__successor(model, k, current)
+                if following == -1:
+                    break
+                couriers.append(k)
+                tails.append(current)
+                heads.append(following)
+                current = following
+        routes = self._get_solution(tuple(np.array(column, dtype=np.int64) for column in (couriers, tails, heads)))
+        self._solution_cache = (model, routes)
+        return routes
+
+    def __found(self, model) -> 'int':
+
+        """
+        Records a new incumbent, publishes it to the portfolio and returns its objective.
+        """
+
+        self._model = model
+        obj = self.__objective_value(model)
+        self._upper = min(self._upper, obj)
+        if self._shared is not None:
+            self._shared.offer(obj, self.__solution(model))
+        return obj
+
+    def __sync(self, lower: 'int', strict: 'bool') -> 'int':
+
+        """
+        Pulls the bounds found by the other solvers of the portfolio: the search is restricted
+        to solutions at most as good as (strict=False) or better than (strict=True) the best
+        objective found by any solver. Returns the best proved lower bound.
+        """
+
+        if self._shared is None:
+            return lower
+        best = self._shared.best()
+        if best < self._upper:
+            self._upper = best
+            self._solver.add(self.__objective_at_most(best - 1 if strict else best))
+        return max(lower, self._shared.lower())
+
+    def __check(self, *assumptions):
+
+        """
+        Runs the solver with the time left before the deadline, recording how long the call took.
+        Returns unknown without calling the solver once the budget is spent.
+        """
+
+        start = time.time()
+        remaining = self._deadline - start
+        if remaining <= 0:
+            return z3.unknown
+        self._solver.set("timeout", max(1, int(remaining * 1000)))
+        status = self._solver.check(*assumptions)
+        self._check_times.append(round(time.time() - start, 3))
+        return status
+
+    def __prove(self) -> None:
+
+        """
+        Marks the best known objective as optimal, for this model and the portfolio.
+        """
+
+        self._optimal_solution_found = True
+        if self._shared is not None:
+            self._shared.prove()
+
+    def __linear_search(self) -> None:
+
+        """
+        Asks for a strictly better solution after each one found, until the solver
+        answers unsat (the last solution is optimal) or gives up.
+        """
+
+        while True:
+            if self.__sync(self._instance.min_path, strict=True) >= self._upper:
+                self.__prove()
+                return
+            status = self.__check()
+            if status == z3.sat:
+                obj = self.__found(self._solver.model())
+                self._solver.add(self.__objective_at_most(obj - 1))
+            else:
+                if status == z3.unsat and self._upper <= self._instance.max_path:
+                    self.__prove()
+                return
+
+    def __binary_search(self) -> None:
+
+        """
+        Bisection on the objective over [min_path, incumbent].
+        Each probe obj <= mid is passed as an assumption literal, so no constraint is
+        retracted and learned clauses are kept; the answer is then added permanently
+        (obj <= found objective on sat, obj > mid on unsat).
+        """
+
+        lower = self.__sync(self._instance.min_path, strict=False)
+
+        # An incumbent (the heuristic one) already at the lower bound leaves nothing to search
+        if lower >= self._upper:
+            self.__prove()
+            return
+
+        # A first solution gives the incumbent, all later probes are below it
+        status = self.__check()
+        if status != z3.sat:
+            return
+        upper = self.__found(self._solver.model())
+
+        while True:
+            lower = self.__sync(lower, strict=False)
+            upper = min(upper, self._upper)
+            if lower >= upper:
+                break
+            mid = (lower + upper) // 2
+            probe = z3.Bool(f'obj_le_{mid}')
+            self._solver.add(z3.Implies(probe, self.__objective_at_most(mid)))
+            status = self.__check(probe)
+            if status == z3.sat:
+                upper = self.__found(self._solver.model())
+                self._solver.add(self.__objective_at_most(upper))
+            elif status == z3.unsat:
+                lower = mid + 1
+                if self._encoding == 'arith':
+                    self._solver.add(self.obj >= lower)
+                if self._shared is not None:
+                    self._shared.raise_lower(lower)
+            else:
+                return
+
+        self.__prove()
 
     def add_constraints(self) -> None:
 
@@ -183,3 +413,98 @@ class Z3_smt_model(general_model):
                         self._solver.add(self._u[k][j]
                                          >= self._u[k][i] + 1 - self._instance.origin * (
                                                  1 - z3.If(self._table[k][i][j], 1, 0)))
+
+    def add_pb_constraints(self) -> None:
+
+        """
+        Pseudo-boolean encoding of the model, without any integer variable:
+        - visit_k_j is true when courier k delivers item j, and equals both "some arc enters j"
+          and "some arc leaves j", with at most one arc each way
+        - cardinality constraints for the depot, the unique delivery of each item and the
+          min_packs/max_packs limits, a weighted PbLe for the capacity
+        - sub-tours are removed with order-encoded positions: pos_j_gt_t is true when item j is
+          delivered after the t-th stop of its route; an arc i -> j forces pos(j) > pos(i), and
+          no route has more than max_packs stops
+        The distance of each courier is kept as weighted arcs (_distance_terms) and only
+        appears in the PbLe bounds added by the search.
+        """
+
+        origin, depot, x = self._instance.origin, self._instance.origin - 1, self._table
+        items = range(origin - 1)
+        max_packs = self._instance.max_packs
+
+        self._visit = [[z3.Bool(f'visit_{k}_{j}') for j in items] for k in range(self._instance.m)]
+        self._distance_terms = [[(x[k][i][j], int(self._instance.distances[i][j]))
+                                 for i in range(origin) for j in range(origin)
+                                 if i != j and self._instance.distances[i][j] > 0]
+                                for k in range(self._instance.m)]
+
+        for k in range(self._instance.m):
+            for i in range(origin):
+                # A courier can't move to the same item
+                self._solver.add(z3.Not(x[k][i][i]))
+
+            for j in items:
+                arcs_in = [x[k][i][j] for i in range(origin) if i != j]
+                arcs_out = [x[k][j][i] for i in range(origin) if i != j]
+                # An item delivered by k is entered and left exactly once by k
+                self._solver.add(self._visit[k][j] == z3.Or(arcs_in))
+                self._solver.add(self._visit[k][j] == z3.Or(arcs_out))
+                self._solver.add(z3.AtMost(*arcs_in, 1))
+                self._solver.add(z3.AtMost(*arcs_out, 1))
+
+            # Couriers start at the origin and end at the origin
+            self._solver.add(z3.PbEq([(x[k][depot][j], 1) for j in items], 1))
+            self._solver.add(z3.PbEq([(x[k][j][depot], 1) for j in items], 1))
+
+            # Capacity and number of delivered items
+            self._solver.add(z3.PbLe([(self._visit[k][j], int(self._instance.size[j])) for j in items],
+                                     int(self._instance.max_load[k])))
+            self._solver.add(z3.AtLeast(*self._visit[k], self._instance.min_packs))
+            self._solver.add(z3.AtMost(*self._visit[k], max_packs))
+
+        for j in items:
+            # Each non-depot node must be visited exactly once
+            self._solver.add(z3.PbEq([(self._visit[k][j], 1) for k in range(self._instance.m)], 1))
+
+        # position_j[t - 1] <=> item j is at least at stop t + 1 of its route, for t = 1..max_packs-1
+        position = [[z3.Bool(f'pos_{j}_gt_{t}') for t in range(1, max_packs)] for j in items]
+        for j in items:
+            for t in range(1, len(position[j])):
+                self._solver.add(z3.Implies(position[j][t], position[j][t - 1]))
+
+        for i in items:
+            for j in items:
+                if i == j:
+                    continue
+                arc = z3.Or([x[k][i][j] for k in range(self._instance.m)])
+                if i < j:
+                    # If a courier goes for i to j then it cannot go from j to i, except for the origin
+                    for k in range(self._instance.m):
+                        self._solver.add(z3.Not(z3.And(x[k][i][j], x[k][j][i])))
+                if max_packs < 2:
+                    self._solver.add(z3.Not(arc))
+                    continue
+                # Sub-tour elimination: pos(j) >= pos(i) + 1 <= max_packs
+                self._solver.add(z3.Implies(arc, position[j][0]))
+                for t in range(1, max_packs - 1):
+                    self._solver.add(z3.Implies(z3.And(arc, position[i][t - 1]), position[j][t]))
+                self._solver.add(z3.Implies(arc, z3.Not(position[i][max_packs - 2])))
+
+        # Upper bound on the objective
+        self._solver.add(self.__objective_at_most(self._instance.max_path))
+
+    def add_symmetry_breaking(self) -> None:
+
+        """
+        Couriers with equal max load (Instance.similar_couriers) are interchangeable: each of them
+        must take a first item of higher index than the previous one of its group.
+        Written as clauses on the depot arcs, so it fits both encodings:
+        table[a][depot][j] -> Or(table[b][depot][l] for l > j).
+        """
+
+        depot, x = self._instance.origin - 1, self._table
+        for group in self._instance.similar_couriers():
+            for a, b in zip(group[:-1], group[1:]):
+                for j in range(depot):
+                    self._solver.add(z3.Implies(x[a][depot][j], z3.Or([x[b][depot][l] for l in range(j + 1, depot)])))
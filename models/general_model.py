@@ -1,4 +1,5 @@
 import time
+import numpy as np
 from instance import Instance # type: ignore
 
 class general_model:
@@ -29,43 +30,83 @@ class general_model:
         #_courier_routes is a dictionary where keys are couriers k and values are empty lists
         self._courier_routes = {k: [] for k in range(instance.m)}
 
-    def _get_solution(self) -> 'list':
+    def _active_arcs(self) -> 'tuple':
+
+        """
+        Arcs in use in the current solution, as parallel arrays (courier, from, to) of 0-based indexes.
+        Reads self._table: a dict (courier, from, to) -> MIP variable, or a nested list of Z3 values.
+        Models able to read all their values at once override this.
+        """
+
+        if self._lib == "mip":
+            # For MIP solvers, use .x attribute to check active routes
+            # (the table may only hold a subset of the arcs)
+            arcs = [key for key, var in self._table.items() if var.x >= 0.5]
+            return tuple(np.array(column, dtype=np.int64) for column in zip(*arcs)) if arcs else \
+                (np.empty(0, dtype=np.int64),) * 3
+
+        # For Z3 solvers, values are boolean
+        values = np.array([[[bool(self._table[k][i][j]) for j in range(self._instance.origin)]
+                            for i in range(self._instance.origin)] for k in range(self._instance.m)], dtype=bool)
+        return np.nonzero(values)
+
+    def _get_solution(self, arcs: 'tuple' = None) -> 'list':
 
         """
         Extracts the computed courier routes from solver variables and formats them
         into readable sequences of visited nodes. Removes redundant depot entries.
+        `arcs` are the arcs in use as returned by _active_arcs, which is called if they are not given.
         """
-        
-        # Extract and populate courier routes
+
+        couriers, tails, heads = self._active_arcs() if arcs is None else arcs
+        successors = self.successor_array(couriers, tails, heads)
+        counts = np.bincount(couriers, minlength=self._instance.m)
+
+        # Create a list to store the routes for each courier
+        routes = []
         for k in range(self._instance.m):
+            self._courier_routes[k] = self.walk_route(successors[k], self._instance.origin - 1, counts[k])
+            routes.append(self._courier_routes[k])
+
+        return routes
 
-            if self._lib == "mip":
-                # For MIP solvers, use .x attribute to check active routes
-                self._courier_routes[k] = [[i + 1, j + 1] for i in range(self._instance.origin) for j in
-                                           range(self._instance.origin) if
-                                           self._table[k, i, j].x == 1]
+    def successor_array(self, couriers: 'np.ndarray', tails: 'np.ndarray', heads: 'np.ndarray') -> 'np.ndarray':
 
-            elif self._lib == "z3":
-                # For Z3 solvers, values are boolean
-                self._courier_routes[k] = [[i + 1, j + 1] for i in range(self._instance.origin) for j in
-                                           range(self._instance.origin) if
-                                           self._table[k][i][j]]
+        """
+        Next node of each courier after each node (m x origin, 0-based), -1 where the courier does not leave it.
+        Raises an exception if a courier leaves a node twice.
+        """
 
+        successors = np.full((self._instance.m, self._instance.origin), -1, dtype=np.int64)
+        successors[couriers, tails] = heads
+        if len(couriers) and np.bincount(couriers * self._instance.origin + tails).max() > 1:
+            raise Exception("invalid solution: a courier leaves a node on more than one arc")
+        return successors
 
-        # Reconstruct full routes from arc pairs
-        for k in range(self._instance.m):
-            self._courier_routes[k] = self.compute_route(self._instance.origin, self._instance.origin, self._courier_routes[k])
-        # Reorder the routes to start from the origin
-        # Remove instance.origin - 1 from the routes
-        for k in range(self._instance.m):
-            if len(self._courier_routes[k]) > 0:
-                m = max(self._courier_routes[k])
-                self._courier_routes[k] = list(filter(lambda d: d < m, self._courier_routes[k]))
+    def walk_route(self, successors: 'np.ndarray', depot: 'int', arcs: 'int') -> 'list':
 
-        # Create a list to store the routes for each courier
-        routes = [self._courier_routes[k] for k in range(self._instance.m)]
-        
-        return routes
+        """
+        Follows the successors of a courier from the depot back to the depot.
+        Returns the visited items as 1-based indexes, depot excluded, or an empty list
+        if the courier does not leave the depot. Raises an exception on a missing arc,
+        a cycle that does not go through the depot, or arcs left out of the route.
+        """
+
+        successors = successors.tolist()
+        route = []
+        current = successors[depot]
+        if current == -1:
+            current = depot
+        while current != depot:
+            if current == -1:
+                raise Exception(f"invalid solution: the route {route} stops before reaching the depot")
+            if len(route) >= len(successors):
+                raise Exception(f"invalid solution: the route {route[:len(successors)]} never returns to the depot")
+            route.append(current + 1)
+            current = successors[current]
+        if arcs > len(route) + 1:
+            raise Exception(f"invalid solution: a sub-tour is disconnected from the route {route}")
+        return route
 
     def get_result(self) -> dict:
         
@@ -83,14 +124,13 @@ class general_model:
         Assumes a valid path exists from start to end.
         """
 
+        successors = dict((i, j) for i, j in pairs) #index the arcs by their starting node
         route = [start] #start with the intiial location
         current = start
-        def get_next(current): #define a help function to find the next step
-            for pair in pairs:
-                if pair[0] == current:
-                    return pair[1]
         while True:
-            current = get_next(current)
+            if current not in successors or len(route) > len(successors):
+                raise Exception(f"no path from {start} to {end} in {pairs}")
+            current = successors[current]
             route.append(current)
             if current == end:
                 return route
@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import hashlib
+import numpy as np
+
+# Bump whenever the bounds computation changes, so stale cached bounds are recomputed
+PRESOLVE_VERSION = 2
+
+
+def file_digest(file_path: 'str') -> 'str':
+
+    """
+    Returns the SHA-1 hex digest of a file's content, used as cache key.
+    """
+
+    with open(file_path, "rb") as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+def greedy_paths(distances: 'np.ndarray', steps: 'int', maximize: 'bool' = False) -> 'tuple':
+
+    """
+    Builds, for every item at once, the greedy path that leaves the depot (last row
+    of `distances`), visits that item and then extends `steps - 1` times to the
+    nearest (or farthest if `maximize`) unvisited node, ties going to the lowest index.
+    Returns the cost of each path and the last node it reaches.
+    """
+
+    o = distances.shape[0] - 1
+    starts = np.arange(o)
+
+    visited = np.zeros((o, o + 1), dtype=bool)
+    visited[starts, starts] = True
+    visited[:, o] = True
+
+    current = starts
+    costs = distances[o, starts].astype(np.int64)
+    masked_value = -1 if maximize else np.iinfo(np.int64).max
+
+    for _ in range(steps - 1):
+        rows = np.where(visited, masked_value, distances[current])
+        current = np.argmax(rows, axis=1) if maximize else np.argmin(rows, axis=1)
+        costs += rows[starts, current]
+        visited[starts, current] = True
+
+    return costs, current
+
+
+def compute_bounds(distances: 'np.ndarray', max_load, size) -> 'dict':
+
+    """
+    Compute lower and upper bounds for travel distance and number of packages per courier.
+    `distances` has the depot as last row/column, `max_load` and `size` may be in any order.
+    These are used to guide and constrain the optimization models of every approach.
+    """
+
+    distances = np.asarray(distances)
+    max_load = np.sort(max_load)
+    m = len(max_load)
+    n = len(size)
+
+    # Depot index in distance matrix
+    o = n
+
+    # Exclude the weakest courier
+    max_weight = int(np.sum(max_load[1:]))
+
+    # prefix[j] is the total size of the j smallest packages
+    prefix = np.concatenate(([0], np.cumsum(np.sort(size))))
+
+    # Minimum number of packages k such that the n - k smallest ones fit in the other couriers
+    k = max(1, n - (int(np.searchsorted(prefix, max_weight, side='right')) - 1))
+    if k == 1:
+        min_path = int(np.max(distances[o, :o] + distances[:o, o]))
+    else:
+        min_origin = int(np.min(distances[:o, o]))
+        costs, _ = greedy_paths(distances, k, maximize=False)
+        min_path = int(np.max(costs)) + min_origin
+
+    # Compute max_packs bound
+    min_packs = k
+
+    # Smallest k such that the k smallest packages fill the biggest courier
+    k = min(max(int(np.searchsorted(prefix, max_load[-1], side='left')), 1), n)
+
+    max_packs = min(k, n - m + 1)
+
+    costs, last = greedy_paths(distances, k, maximize=True)
+    max_path = int(np.max(costs + distances[last, o]))
+
+    return {'min_path': min_path, 'max_path': max_path, 'min_packs': min_packs, 'max_packs': max_packs}
+
+
+def shortest_paths(distances: 'np.ndarray') -> 'np.ndarray':
+
+    """
+    All-pairs shortest path lengths (Floyd-Warshall, one vectorized relaxation per node).
+    Needed because instance distances are not guaranteed to satisfy the triangle inequality.
+    """
+
+    sp = np.array(distances, dtype=np.int64)
+    for v in range(sp.shape[0]):
+        sp = np.minimum(sp, sp[:, v, None] + sp[None, v, :])
+    return sp
+
+
+def prune_arcs(distances: 'np.ndarray', max_load, size, max_path: 'int') -> 'np.ndarray':
+
+    """
+    Returns a boolean mask of shape (m, n+1, n+1) telling which arcs (i, j) courier k
+    may use in some solution. An arc is dropped if it is a self-loop, if the shortest
+    closed route from the depot through it is longer than `max_path`, or if the
+    packages at its two ends do not fit together in the courier.
+    `max_load` must follow the courier order used by the model.
+    """
+
+    distances = np.asarray(distances)
+    o = distances.shape[0] - 1
+    sp = shortest_paths(distances)
+
+    # Shortest depot -> i -> j -> depot route using the arc (i, j)
+    through = sp[o, :, None] + distances + sp[None, :, o]
+    allowed = (through <= max_path) & ~np.eye(o + 1, dtype=bool)
+
+    # Load of the two ends of each arc, the depot carries nothing
+    node_size = np.append(np.asarray(size), 0)
+    pair_size = node_size[:, None] + node_size[None, :]
+    fits = pair_size[None, :, :] <= np.asarray(max_load)[:, None, None]
+
+    return allowed[None, :, :] & fits
+
+
+def timed_bounds(distances: 'np.ndarray', max_load, size) -> 'dict':
+
+    """
+    compute_bounds, with the time it took as `presolve_time`.
+    """
+
+    start_time = time.time()
+    bounds = compute_bounds(distances, max_load, size)
+    bounds['presolve_time'] = time.time() - start_time
+    return bounds
+
+
+def load_bounds(file_path: 'str', distances: 'np.ndarray', max_load, size,
+                cache_directory: 'str' = '.cache/instances') -> 'dict':
+
+    """
+    Returns the bounds of the instance stored in `file_path`, reading them from
+    `<cache_directory>/<sha1>.bounds.json` when available and computing and
+    caching them otherwise. Pass cache_directory=None to always recompute.
+    The bounds also hold `presolve_time`, the seconds taken by their computation,
+    which is cached with them so that a cache hit reports the original time.
+    """
+
+    if cache_directory is None:
+        return timed_bounds(distances, max_load, size)
+
+    cache_path = os.path.join(cache_directory, file_digest(file_path) + '.bounds.json')
+
+    if os.path.exists(cache_path):
+        with open(cache_path, "r") as file:
+            cached = json.load(file)
+        if cached.get('version') == PRESOLVE_VERSION:
+            return cached['bounds']
+
+    bounds = timed_bounds(distances, max_load, size)
+    os.makedirs(cache_directory, exist_ok=True)
+    # Write to a temporary file first so concurrent runs never read a partial cache
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump({'version': PRESOLVE_VERSION, 'bounds': bounds}, file)
+    os.replace(tmp_path, cache_path)
+    return bounds
@@ -0,0 +1,81 @@
+import os
+import json
+import time
+
+
+def best_result(new: 'dict', old: 'dict') -> 'dict':
+
+    """
+    The better of two results of the same job: a solution over none, then a proved optimum,
+    then the lower objective. Ties go to the new result.
+    """
+
+    def rank(result):
+        has_solution = isinstance(result.get('obj'), int) and result.get('sol') is not None
+        return (not has_solution, not result.get('optimal', False), result['obj'] if has_solution else 0)
+
+    return old if rank(old) < rank(new) else new
+
+
+class Result_store:
+
+    """
+    Append-only store of solver results, one JSON object per line.
+    Each result is appended with a single write followed by fsync as soon as its job ends,
+    so a crash loses at most the jobs that were still running. A last line cut short by a
+    crash is ignored when reading. When a job is recorded more than once with the same configuration,
+    the last record wins.
+    """
+
+    def __init__(self, path: 'str' = os.path.join('.cache', 'results.jsonl')):
+        self.path = path
+
+    def append(self, model: 'str', solver: 'str', instance: 'str', result: 'dict', config: 'str' = None) -> None:
+
+        """
+        Durably records the result of one (model, solver, instance) job.
+        `config` identifies the options the result was obtained with (see scheduler.config_hash).
+        """
+
+        record = {'model': model, 'solver': solver, 'instance': instance, 'config': config, 'result': result,
+                  'recorded': round(time.time(), 3)}
+        line = (json.dumps(record, separators=(',', ':')) + '\n').encode()
+
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            # Terminate a line left incomplete by a crash, so that it does not swallow this record
+            size = os.fstat(fd).st_size
+            if size > 0 and os.pread(fd, 1, size - 1) != b'\n':
+                line = b'\n' + line
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def records(self):
+
+        """
+        Yields the valid records in the order they were appended, reading the store once.
+        """
+
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(record, dict) and {'model', 'solver', 'instance', 'result'} <= record.keys():
+                    yield record
+
+    def latest(self) -> 'dict':
+
+        """
+        Last record of every job and configuration, keyed by (model, solver, instance, config).
+        """
+
+        return {(record['model'], record['solver'], record['instance'], record.get('config')): record
+                for record in self.records()}
@@ -0,0 +1,294 @@
+import os
+import json
+import time
+import signal
+import hashlib
+import multiprocessing
+from multiprocessing.connection import wait
+
+from typing import Union
+
+from models.MIP.mip import Mip_model
+from models.SMT.smt import Z3_smt_model
+from models.SMT.portfolio import Z3_portfolio
+from instance import Instance
+from json_parser import Json_parser
+from result_store import best_result
+
+
+# Options only read by the Z3 portfolio
+portfolio_options = ('portfolio', 'portfolio_size')
+
+
+def config_hash(config: 'dict', solver: 'str') -> 'str':
+
+    """
+    Hash of the options of a configuration section that can change the results of one of its
+    solvers (the job's sub folder, e.g. "mip_CBC" or "z3_smt"). The time budget, the export folder
+    and the lists of libraries and solvers to run are excluded, and so are the portfolio options
+    for the other solvers, so that enabling a solver does not invalidate the results of the others.
+    """
+
+    options = {key: value for key, value in config.items()
+               if key not in ('timeout', 'export_folder', 'library', 'solvers') and not key.endswith('_solvers')
+               and (solver == 'z3_portfolio' or key not in portfolio_options)}
+    return hashlib.sha1(json.dumps(options, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def build_jobs(config: 'dict', instances: 'list[Instance]') -> 'list[dict]':
+
+    """
+    Expands the configuration into one job per (model, library, solver, instance).
+    Jobs are returned largest instance first so the longest runs start early
+    and the tail of the sweep stays short.
+    """
+
+    jobs = []
+    models_to_use = config['usage_mode']['models_to_use']
+
+    if 'mip' in models_to_use:
+        for lib in config['mip']['library']:
+            for solver_name in config['mip'][lib + '_solvers']:
+                for instance in instances:
+                    jobs.append({'model': 'MIP', 'lib': lib, 'solver': solver_name,
+                                 'sub_folder': lib + '_' + solver_name, 'instance': instance,
+                                 'config': config['mip'],
+                                 'config_hash': config_hash(config['mip'], lib + '_' + solver_name),
+                                 'timeout': config['mip']['timeout']})
+
+    if 'smt' in models_to_use:
+        for lib in config['smt']['library']:
+            for solver_name in config['smt']['solvers']:
+                for instance in instances:
+                    jobs.append({'model': 'SMT', 'lib': lib, 'solver': solver_name,
+                                 'sub_folder': solver_name, 'instance': instance,
+                                 'config': config['smt'], 'config_hash': config_hash(config['smt'], solver_name),
+                                 'timeout': config['smt']['timeout']})
+
+    # Number of arc variables is a good proxy for the solving effort
+    jobs.sort(key=lambda job: job['instance'].m * job['instance'].origin ** 2, reverse=True)
+    return jobs
+
+
+def valid_result(instance: 'Instance', result: 'dict') -> 'bool':
+
+    """
+    Whether a recorded result holds a solution delivering every item exactly once.
+    """
+
+    if result.get('obj') is None or result.get('sol') is None:
+        return False
+    items = sorted(item for route in result['sol'] for item in route)
+    return len(result['sol']) == instance.m and items == list(range(1, instance.n + 1))
+
+
+def resume_jobs(jobs: 'list[dict]', records: 'dict', retry_timeout: 'int' = None) -> 'list[dict]':
+
+    """
+    Keeps the jobs that still need to run, given the last recorded result of each
+    (model, solver, instance, config) as returned by Result_store.latest():
+    - jobs with a valid optimal result obtained with the same configuration are dropped;
+    - jobs that timed out or failed are run again, with `retry_timeout` seconds if given,
+      and keep their recorded solution, if valid, unless the new one is better;
+    - jobs never recorded, or recorded with another configuration, run as usual.
+    """
+
+    remaining, done, retried = [], 0, 0
+    for job in jobs:
+        record = records.get((job['model'], job['sub_folder'], job['instance'].name, job['config_hash']))
+        if record is None:
+            remaining.append(job)
+            continue
+        valid = valid_result(job['instance'], record['result'])
+        if valid and record['result'].get('optimal', False):
+            done += 1
+        else:
+            retried += 1
+            remaining.append(dict(job, previous=record['result'] if valid else None,
+                                  timeout=retry_timeout if retry_timeout is not None else job['timeout']))
+    print(f"resuming: {done} jobs already solved, {retried} timed out and run again, "
+          f"{len(remaining) - retried} missing")
+    return remaining
+
+
+def build_model(model: 'str', lib: 'str', solver_name: 'str', instance: 'Instance', config: 'dict'):
+
+    """
+    Instantiates the solver model for the given approach, passing on the
+    model options found in its configuration section.
+    """
+
+    if model == 'MIP':
+        if lib == 'mip':
+            return Mip_model(lib, instance, solver_name=solver_name,
+                             formulation=config.get('formulation', 'dense'),
+                             subtour_elimination=config.get('subtour_elimination', 'mtz'),
+                             warm_start=config.get('warm_start', False),
+                             symmetry_breaking=config.get('symmetry_breaking', False))
+    elif model == 'SMT':
+        if lib == 'z3' and solver_name == 'z3_portfolio':
+            return Z3_portfolio(lib, instance, config)
+        if lib == 'z3':
+            return Z3_smt_model(lib, instance, warm_start=config.get('warm_start', False),
+                                search=config.get('search', 'linear'),
+                                encoding=config.get('encoding', 'arith'), tactics=config.get('tactics'),
+                                symmetry_breaking=config.get('symmetry_breaking', False))
+    raise Exception(f"unknown lib {lib}")
+
+
+def _run_job(job: 'dict', conn) -> None:
+
+    """
+    Worker entry point: builds and solves a single job, then sends the result
+    back to the scheduler through the pipe.
+    """
+
+    # Own session and process group, so that a kill also reaches the processes the job starts
+    # (the solvers of a Z3 portfolio)
+    if hasattr(os, 'setsid'):
+        os.setsid()
+    try:
+        solver = build_model(job['model'], job['lib'], job['solver'], job['instance'], job['config'])
+        solver.solve(processes=job['config'].get('threads', 1), timeout=job['timeout'])
+        conn.send(('ok', solver.get_result()))
+    except Exception as e:
+        conn.send(('error', repr(e)))
+    finally:
+        conn.close()
+
+
+def _kill_job(process) -> None:
+
+    """
+    Kills the process group of a job: the worker if it is still running and any process it
+    started, including those left behind after the worker exited.
+    Falls back to the worker alone if it has not created its group yet.
+    """
+
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(process.pid, signal.SIGKILL)
+            return
+    except (ProcessLookupError, PermissionError):
+        pass
+    process.kill()
+
+
+class Job_scheduler:
+
+    """
+    Runs solver jobs on a pool of worker processes.
+    Each job lives in its own process so that it can be killed once it exceeds
+    its wall-clock budget, and each result is saved as soon as the job finishes.
+    """
+
+    def __init__(self, workers: 'int' = 1, json_parser: 'Json_parser' = None, grace: 'int' = 10):
+        self.workers = max(1, workers)
+        self.json_parser = json_parser if json_parser is not None else Json_parser()
+        # Extra seconds granted on top of the job timeout before killing it
+        self.grace = grace
+
+    def run(self, jobs: 'list[dict]') -> None:
+
+        """
+        Schedules all jobs in the given order, keeping at most `workers` running.
+        On interruption, every running job is killed before the interruption is raised again.
+        """
+
+        pending = list(jobs)
+        running = []
+
+        try:
+            self.__schedule(pending, running)
+        except KeyboardInterrupt:
+            # Jobs run in their own session and do not receive the terminal's interruption
+            print("Interrupted, stopping all jobs.")
+            for r in running:
+                _kill_job(r['process'])
+                r['process'].join()
+                r['conn'].close()
+            raise
+
+    def __schedule(self, pending: 'list[dict]', running: 'list[dict]') -> None:
+
+        """
+        Runs the pending jobs, keeping `running` up to date so that they can be stopped on interruption.
+        """
+
+        while pending or running:
+            # Fill the free worker slots
+            while pending and len(running) < self.workers:
+                job = pending.pop(0)
+                recv_conn, send_conn = multiprocessing.Pipe(duplex=False)
+                # Not a daemon: the Z3 portfolio starts processes of its own
+                process = multiprocessing.Process(target=_run_job, args=(job, send_conn))
+                process.start()
+                send_conn.close()
+                start = time.time()
+                running.append({'job': job, 'process': process, 'conn': recv_conn, 'start': start,
+                                'deadline': start + job['timeout'] + self.grace})
+                print(f"started {job['model']} {job['sub_folder']} on instance {job['instance'].name}")
+
+            # Sleep until a job finishes or the closest deadline expires
+            next_deadline = min(r['deadline'] for r in running)
+            waitables = [r['conn'] for r in running] + [r['process'].sentinel for r in running]
+            wait(waitables, timeout=max(0.0, next_deadline - time.time()))
+
+            for r in list(running):
+                result = self.__collect(r)
+                if result is not None:
+                    running.remove(r)
+                    self.__save(r['job'], result)
+
+    def __collect(self, r: 'dict') -> 'Union[dict, None]':
+
+        """
+        Returns the result of a running job if it is finished, killing it if
+        it went past its deadline. Returns None if the job is still running.
+        """
+
+        job = r['job']
+        if r['conn'].poll():
+            try:
+                status, payload = r['conn'].recv()
+            except EOFError:
+                status, payload = 'error', 'worker exited without a result'
+            r['process'].join()
+            r['conn'].close()
+            if status == 'ok':
+                return payload
+            print(f"job {job['model']} {job['sub_folder']} on instance {job['instance'].name} failed: {payload}")
+            return self.__empty_result(time.time() - r['start'], job['timeout'])
+
+        if not r['process'].is_alive():
+            # The processes it started may have survived it
+            _kill_job(r['process'])
+            r['conn'].close()
+            print(f"job {job['model']} {job['sub_folder']} on instance {job['instance'].name} "
+                  f"exited with code {r['process'].exitcode}")
+            return self.__empty_result(time.time() - r['start'], job['timeout'])
+
+        if time.time() > r['deadline']:
+            _kill_job(r['process'])
+            r['process'].join()
+            r['conn'].close()
+            print(f"job {job['model']} {job['sub_folder']} on instance {job['instance'].name} killed on timeout")
+            return self.__empty_result(job['timeout'], job['timeout'])
+
+        return None
+
+    def __empty_result(self, elapsed: 'float', timeout: 'int') -> 'dict':
+        return {'time': round(min(elapsed, timeout), 3), 'optimal': False, 'obj': None, 'sol': None}
+
+    def __save(self, job: 'dict', result: 'dict') -> None:
+        instance = job['instance']
+        # A job run again after a timeout keeps its recorded result unless the new one is better
+        if job.get('previous') is not None and best_result(result, job['previous']) is job['previous']:
+            print(f"{job['model']} {job['sub_folder']} on instance {instance.name} did not improve on "
+                  f"the recorded result")
+            return
+        self.json_parser.save_results(job['model'], instance.name, result, instance.max_load_indexes,
+                                      job['sub_folder'], job.get('config_hash'), job['timeout'])
+        print("<----------------------------------------------->")
+        print(f"solution for {job['model']} {job['sub_folder']} on instance {instance.name}:")
+        print(result)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules live at the repository root, which is not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
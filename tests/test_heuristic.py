@@ -0,0 +1,37 @@
+import os
+
+import numpy as np
+import pytest
+
+from heuristic import initial_solution, route_length, two_opt
+from instance import Instance
+
+instances_folder = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'Instances')
+
+
+@pytest.mark.parametrize('filename', sorted(os.listdir(instances_folder)))
+def test_initial_solution_is_feasible(filename):
+    instance = Instance(os.path.join(instances_folder, filename), cache_directory=None)
+    solution = initial_solution(instance)
+    assert solution is not None
+
+    routes = solution['routes']
+    assert len(routes) == instance.m
+    assert sorted(item for route in routes for item in route) == list(range(instance.n))
+    for route, capacity in zip(routes, instance.max_load):
+        assert sum(instance.size[item] for item in route) <= capacity
+        assert instance.min_packs <= len(route) <= instance.max_packs
+    lengths = [route_length(np.asarray(instance.distances), route) for route in routes]
+    assert solution['obj'] == max(lengths)
+    assert instance.min_path <= solution['obj'] <= instance.max_path
+
+
+def test_two_opt_never_lengthens_a_route():
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        distances = rng.integers(1, 50, (13, 13))
+        np.fill_diagonal(distances, 0)
+        route = rng.permutation(12).tolist()
+        improved = two_opt(distances, route)
+        assert sorted(improved) == sorted(route)
+        assert route_length(distances, improved) <= route_length(distances, route)
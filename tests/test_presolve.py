@@ -0,0 +1,68 @@
+import os
+from itertools import permutations, product
+
+import numpy as np
+import pytest
+
+from instance import read_dat
+from presolve import compute_bounds, load_bounds, prune_arcs, shortest_paths
+
+instance_file = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'Instances', 'inst01.dat')
+
+
+def random_instance(seed: 'int') -> 'tuple':
+    # Distances closed under shortest paths, like those of the instances the bounds are computed for
+    rng = np.random.default_rng(seed)
+    m, n = int(rng.integers(2, 4)), 5
+    distances = rng.integers(1, 20, (n + 1, n + 1))
+    np.fill_diagonal(distances, 0)
+    size = rng.integers(1, 10, n).tolist()
+    return shortest_paths(distances), sorted(rng.integers(sum(size) // m, 30, m).tolist()), size
+
+
+def optimal_solution(distances: 'np.ndarray', max_load: 'list', size: 'list') -> 'tuple':
+    # Brute force over every assignment and every visiting order
+    m, n = len(max_load), len(size)
+
+    def tour(items):
+        return min((distances[n, p[0]] + sum(distances[a, b] for a, b in zip(p, p[1:])) + distances[p[-1], n], p)
+                   for p in permutations(items))
+
+    best = None
+    for assignment in product(range(m), repeat=n):
+        routes = [[j for j in range(n) if assignment[j] == k] for k in range(m)]
+        if any(not route or sum(size[j] for j in route) > max_load[k] for k, route in enumerate(routes)):
+            continue
+        tours = [tour(route) for route in routes]
+        obj = max(length for length, _ in tours)
+        if best is None or obj < best[0]:
+            best = (obj, [list(p) for _, p in tours])
+    return best
+
+
+def instances():
+    data = read_dat(instance_file)
+    yield data['distances'], sorted(data['max_load'].tolist()), data['size'].tolist()
+    for seed in range(4):
+        yield random_instance(seed)
+
+
+@pytest.mark.parametrize('distances, max_load, size', list(instances()))
+def test_bounds_keep_an_optimal_solution(distances, max_load, size):
+    obj, routes = optimal_solution(distances, max_load, size)
+    bounds = compute_bounds(distances, max_load, size)
+    allowed = prune_arcs(distances, max_load, size, bounds['max_path'])
+
+    assert bounds['min_path'] <= obj <= bounds['max_path']
+    origin = len(size)
+    for k, route in enumerate(routes):
+        assert bounds['min_packs'] <= len(route) <= bounds['max_packs']
+        path = [origin] + route + [origin]
+        assert all(allowed[k, i, j] for i, j in zip(path, path[1:]))
+
+
+def test_cached_bounds_report_the_original_presolve_time(tmp_path):
+    data = read_dat(instance_file)
+    computed = load_bounds(instance_file, data['distances'], data['max_load'], data['size'], str(tmp_path))
+    cached = load_bounds(instance_file, data['distances'], data['max_load'], data['size'], str(tmp_path))
+    assert cached == computed
@@ -0,0 +1,60 @@
+import json
+import os
+
+from mcp import merge_json_files
+from result_store import Result_store, best_result
+from scheduler import config_hash
+
+
+def result(obj, optimal: 'bool' = False) -> 'dict':
+    return {'time': 3 if optimal else 300, 'optimal': optimal, 'obj': obj,
+            'sol': None if obj is None else [[1, 2], [3]]}
+
+
+def test_best_result_prefers_a_solution():
+    found, empty = result(20), result(None)
+    assert best_result(empty, found) is found
+    assert best_result(found, empty) is found
+
+
+def test_best_result_prefers_an_optimum_then_the_lower_objective():
+    optimal, better, worse = result(15, optimal=True), result(10), result(12)
+    assert best_result(better, optimal) is optimal
+    assert best_result(worse, better) is better
+    assert best_result(better, worse) is better
+
+
+def test_best_result_ties_go_to_the_new_result():
+    old, new = result(10), result(10)
+    assert best_result(new, old) is new
+
+
+def test_latest_keeps_the_last_record_of_each_configuration(tmp_path):
+    store = Result_store(str(tmp_path / 'results.jsonl'))
+    store.append('SMT', 'z3_smt', 'inst01', result(12), 'a')
+    store.append('SMT', 'z3_smt', 'inst01', result(10), 'a')
+    store.append('SMT', 'z3_smt', 'inst01', result(30), 'b')
+    with open(store.path, 'a') as f:
+        f.write('{"model": "SMT", "solv')
+
+    latest = store.latest()
+    assert latest[('SMT', 'z3_smt', 'inst01', 'a')]['result']['obj'] == 10
+    assert latest[('SMT', 'z3_smt', 'inst01', 'b')]['result']['obj'] == 30
+    assert len(latest) == 2
+
+
+def test_merge_keeps_the_results_of_the_current_configuration(tmp_path):
+    instances = tmp_path / 'instances'
+    instances.mkdir()
+    (instances / 'inst01.dat').write_text('2\n3\n')
+    smt = {'library': ['z3'], 'solvers': ['z3_smt'], 'search': 'binary', 'timeout': 300}
+    # The section of the model not in use can be left out
+    config = {'instances_path': str(instances), 'usage_mode': {'models_to_use': ['smt']}, 'smt': smt}
+
+    store = Result_store(str(tmp_path / 'results.jsonl'))
+    store.append('SMT', 'z3_smt', 'inst01', result(10), config_hash(smt, 'z3_smt'))
+    store.append('SMT', 'z3_smt', 'inst01', result(30), config_hash(dict(smt, search='linear'), 'z3_smt'))
+    merge_json_files(store, str(tmp_path / 'res'), config)
+
+    with open(os.path.join(tmp_path, 'res', 'SMT', 'inst01.json')) as f:
+        assert json.load(f)['z3_smt']['obj'] == 10
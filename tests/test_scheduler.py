@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+from scheduler import config_hash, resume_jobs
+
+
+smt_config = {'library': ['z3'], 'solvers': ['z3_smt'], 'search': 'binary', 'encoding': 'pb',
+              'portfolio': [{'seed': 0}], 'timeout': 300, 'export_folder': 'export/smt'}
+
+instance = SimpleNamespace(name='inst01', m=2, n=3)
+
+
+def job(solver: 'str' = 'z3_smt') -> 'dict':
+    return {'model': 'SMT', 'lib': 'z3', 'solver': solver, 'sub_folder': solver, 'instance': instance,
+            'config': smt_config, 'config_hash': config_hash(smt_config, solver), 'timeout': 300}
+
+
+def record(result: 'dict', solver: 'str' = 'z3_smt', config: 'str' = None) -> 'dict':
+    config = config or config_hash(smt_config, solver)
+    return {('SMT', solver, 'inst01', config): {'model': 'SMT', 'solver': solver, 'instance': 'inst01',
+                                                'config': config, 'result': result}}
+
+
+def test_config_hash_ignores_other_solvers():
+    other = dict(smt_config, solvers=['z3_smt', 'z3_portfolio'], portfolio=[{'seed': 1}], timeout=10)
+    assert config_hash(other, 'z3_smt') == config_hash(smt_config, 'z3_smt')
+    assert config_hash(other, 'z3_portfolio') != config_hash(smt_config, 'z3_portfolio')
+
+
+def test_config_hash_follows_model_options():
+    assert config_hash(dict(smt_config, search='linear'), 'z3_smt') != config_hash(smt_config, 'z3_smt')
+
+
+def test_resume_skips_optimal_results():
+    optimal = {'time': 3, 'optimal': True, 'obj': 10, 'sol': [[1, 2], [3]]}
+    assert resume_jobs([job()], record(optimal)) == []
+
+
+def test_resume_retries_timeouts_keeping_the_solution():
+    timed_out = {'time': 300, 'optimal': False, 'obj': 12, 'sol': [[1], [2, 3]]}
+    remaining = resume_jobs([job()], record(timed_out), retry_timeout=60)
+    assert len(remaining) == 1
+    assert remaining[0]['timeout'] == 60 and remaining[0]['previous'] is timed_out
+
+
+def test_resume_drops_invalid_solutions():
+    missing_item = {'time': 300, 'optimal': True, 'obj': 7, 'sol': [[1], [2]]}
+    remaining = resume_jobs([job()], record(missing_item))
+    assert len(remaining) == 1 and remaining[0]['previous'] is None
+
+
+def test_resume_reruns_other_configurations():
+    optimal = {'time': 3, 'optimal': True, 'obj': 10, 'sol': [[1, 2], [3]]}
+    remaining = resume_jobs([job()], record(optimal, config='other'))
+    assert len(remaining) == 1 and 'previous' not in remaining[0]